@@ -0,0 +1,235 @@
+import io
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+import contextlib
+import subprocess
+import numpy as np
+
+# Benchmarks of the hot paths of the engine on fixed, seeded scenarios, to get numbers before and after a change:
+#   python benchmark.py --output before.json
+#   ... change ...
+#   python benchmark.py --compare before.json
+# Every scenario is run REPEAT times and its median is kept, the results are written as JSON (see run_benchmarks)
+# and the compare mode flags the scenarios that got slower than the baseline by more than a threshold
+
+SEED = 0
+REPEAT = 3
+# relative slowdown against the baseline that counts as a regression
+THRESHOLD = 0.1
+NOTEBOOK_PATH = "genetic_algorithm.ipynb"
+# positions of the movegen and look_forward scenarios: the perft positions and RANDOM_POSITIONS positions reached by
+# RANDOM_PLIES random moves from the start
+RANDOM_POSITIONS = 8
+RANDOM_PLIES = 20
+
+
+def seed_everything(seed):
+    """seeds python, numpy and tensorflow so that every run plays the same moves and builds the same networks"""
+    import tensorflow as tf
+    random.seed(seed)
+    np.random.seed(seed)
+    tf.random.set_seed(seed)
+
+
+def benchmark_boards(seed):
+    """returns the Boards of the movegen and look_forward scenarios (the same ones for a seed)"""
+    import perft
+    boards = [perft.make_board(position) for position in perft.POSITIONS]
+    rng = random.Random(seed)
+    for _ in range(RANDOM_POSITIONS):
+        board = perft.make_board()
+        for _ in range(RANDOM_PLIES):
+            moves = board.side_to_move.generate_legal_moves()
+            if not moves:
+                break
+            board.make_move(rng.choice(moves))
+        boards.append(board)
+    return boards
+
+
+def timed(function, *args):
+    """returns the seconds function(*args) takes"""
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def movegen(seed, quick=False):
+    """legal move generation (with the check state of the position): positions per second"""
+    boards = benchmark_boards(seed)
+    rounds = 20 if quick else 200
+
+    def generate():
+        for _ in range(rounds):
+            for board in boards:
+                # drops the attack maps and pins kept from the previous round
+                board.update_check_state()
+                board.side_to_move.generate_legal_moves()
+    return rounds * len(boards) / timed(generate)
+
+
+def look_forward(seed, quick=False, depth=0):
+    """robot Player.look_forward to depth: milliseconds per move"""
+    boards = benchmark_boards(seed)
+    if depth >= 2:
+        boards = boards[:2] if quick else boards[:4]
+
+    def choose():
+        for board in boards:
+            board.side_to_move.look_forward(max_depth=depth)
+    return 1000 * timed(choose) / len(boards)
+
+
+def forward_pass(seed, quick=False):
+    """NeuralNet.forward_pass of an ai player: milliseconds per move"""
+    from chess import Player, Board
+    white = Player("white", "ai")
+    Board(white, Player("black", "ai"))
+    encoded_board = white.encode_board()
+    # the first call builds the tensorflow graph
+    white.nn.forward_pass(encoded_board)
+    calls = 10 if quick else 100
+
+    def passes():
+        for _ in range(calls):
+            white.nn.forward_pass(encoded_board)
+    return 1000 * timed(passes) / calls
+
+
+def play(seed, quick=False, headless=False):
+    """robot against robot Board.play(show=False) (or headless): games per second"""
+    from chess import Player, Board
+    games = 1 if quick else 3
+
+    def games_played():
+        for _ in range(games):
+            board = Board(Player("white", "robot", max_depth=0), Player("black", "robot", max_depth=0), max_steps=200)
+            board.play(show=False, verbose=False, headless=headless)
+    return games / timed(games_played)
+
+
+def load_population(path=NOTEBOOK_PATH):
+    """returns the Population class of the genetic algorithm notebook (defined in its first code cell)"""
+    with open(path) as f:
+        cells = json.load(f)["cells"]
+    source = "".join(next(cell for cell in cells if cell["cell_type"] == "code")["source"])
+    namespace = {}
+    exec(source, namespace)
+    return namespace["Population"]
+
+
+def population(seed, quick=False):
+    """Population.run of the genetic algorithm: generations per hour"""
+    population_class = load_population()
+    generations = 1 if quick else 2
+    trained = population_class(size=4, recreation_rate=0.5)
+    return 3600 * generations / timed(lambda: trained.run(max_gen=generations, save=False, verbose=False))
+
+
+# name: (function, keyword arguments, unit, True if a higher value is better)
+SCENARIOS = {
+    "movegen": (movegen, {}, "positions/s", True),
+    "look_forward_depth_0": (look_forward, {"depth": 0}, "ms/move", False),
+    "look_forward_depth_1": (look_forward, {"depth": 1}, "ms/move", False),
+    "look_forward_depth_2": (look_forward, {"depth": 2}, "ms/move", False),
+    "forward_pass": (forward_pass, {}, "ms/move", False),
+    "play": (play, {}, "games/s", True),
+    "play_headless": (play, {"headless": True}, "games/s", True),
+    "population": (population, {}, "generations/h", True),
+}
+
+
+def git_commit():
+    """returns the short hash of the checked out commit (None outside a git repository)"""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(names=None, seed=SEED, repeat=REPEAT, quick=False, verbose=True):
+    """runs the scenarios (every one of SCENARIOS by default) and returns the results as a dict:
+    {"meta": {...}, "results": {name: {"value": median, "runs": [...], "unit": str, "higher_is_better": bool}}}
+    a scenario that raised has {"error": str} instead
+    every run is seeded with seed, the printed output of the engine is swallowed
+    """
+    results = {}
+    for name in names or SCENARIOS:
+        function, kwargs, unit, higher_is_better = SCENARIOS[name]
+        runs = []
+        try:
+            for _ in range(repeat):
+                seed_everything(seed)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    runs.append(function(seed, quick, **kwargs))
+        except Exception as error:
+            # e.g. the ai scenarios without a working tensorflow: the other scenarios are still measured
+            results[name] = {"error": f"{type(error).__name__}: {error}"}
+            if verbose:
+                print(f"{name}: failed ({results[name]['error']})")
+            continue
+        results[name] = {"value": statistics.median(runs), "runs": runs, "unit": unit,
+                         "higher_is_better": higher_is_better}
+        if verbose:
+            print(f"{name}: {results[name]['value']:.4g} {unit}")
+    meta = {"commit": git_commit(), "time": time.strftime("%Y-%m-%d %H:%M:%S"), "python": platform.python_version(),
+            "numpy": np.__version__, "platform": platform.platform(), "seed": seed, "repeat": repeat, "quick": quick}
+    return {"meta": meta, "results": results}
+
+
+def compare(baseline, current, threshold=THRESHOLD, verbose=True):
+    """returns the names of the scenarios of current that are more than threshold (relative) slower than baseline
+    args:
+    baseline, current: dicts of run_benchmarks
+    """
+    regressions = []
+    for name, result in current["results"].items():
+        if "value" not in result or "value" not in baseline["results"].get(name, {}):
+            continue
+        before = baseline["results"][name]["value"]
+        change = result["value"] / before - 1 if before else 0
+        # a positive slowdown is worse: less throughput or more time per move
+        slowdown = -change if result["higher_is_better"] else change
+        if slowdown > threshold:
+            regressions.append(name)
+        if verbose:
+            flag = "  SLOWER" if slowdown > threshold else "  faster" if slowdown < -threshold else ""
+            print(f"{name}: {before:.4g} -> {result['value']:.4g} {result['unit']} ({change:+.1%}){flag}")
+    return regressions
+
+
+if __name__ == '__main__':
+    # python benchmark.py [--only name ...] [--quick] [--output results.json] [--compare baseline.json]
+    parser = argparse.ArgumentParser(description="benchmarks the engine on fixed scenarios")
+    parser.add_argument("--only", nargs="+", choices=list(SCENARIOS), help="scenarios to run (all by default)")
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="runs per scenario, the median is kept")
+    parser.add_argument("--quick", action="store_true", help="smaller scenarios for a fast check")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to compare the results with")
+    parser.add_argument("--current", help="compare this JSON file with the baseline instead of running")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="relative slowdown flagged as regression")
+    args = parser.parse_args()
+
+    if args.current:
+        with open(args.current) as f:
+            current = json.load(f)
+    else:
+        current = run_benchmarks(args.only, args.seed, args.repeat, args.quick)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, current, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
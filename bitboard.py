@@ -0,0 +1,279 @@
+import numpy as np
+
+# Squares are numbered 0-63 from the x-y coordinates used everywhere else (x, y in [1,8]):
+# square = (y - 1) * 8 + (x - 1), so bit 0 is (1,1), bit 7 is (8,1) and bit 63 is (8,8)
+# A bitboard is a python int where bit i is set if square i belongs to the set
+
+PIECE_TYPES = ("pawn", "knight", "bishop", "rook", "queen", "king")
+COLORS = ("white", "black")
+
+FULL_BOARD = 0xFFFFFFFFFFFFFFFF
+FILE_1 = 0x0101010101010101     # every square with x=1
+FILE_8 = FILE_1 << 7            # every square with x=8
+NOT_FILE_1 = FULL_BOARD ^ FILE_1
+NOT_FILE_8 = FULL_BOARD ^ FILE_8
+NOT_FILE_12 = FULL_BOARD ^ (FILE_1 | (FILE_1 << 1))
+NOT_FILE_78 = FULL_BOARD ^ (FILE_8 | (FILE_8 >> 1))
+ROW_1 = 0xFF                    # every square with y=1
+ROW_8 = ROW_1 << 56             # every square with y=8
+PROMOTION_ROWS = ROW_1 | ROW_8
+
+
+def square_index(position):
+    """returns the square (0-63) of an x-y position (np.array or tuple)"""
+    return (int(position[1]) - 1) * 8 + (int(position[0]) - 1)
+
+
+def square_position(square):
+    """returns the x-y position (np.array) of a square (0-63)"""
+    return np.array([square % 8 + 1, square // 8 + 1])
+
+
+def iter_squares(bb):
+    """yields the squares of the set bits of a bitboard, lowest square first"""
+    while bb:
+        lowest = bb & -bb
+        yield lowest.bit_length() - 1
+        bb ^= lowest
+
+
+def pop_count(bb):
+    """returns the number of set bits (squares) of a bitboard"""
+    return bb.bit_count()
+
+
+# One step shifts in every direction, x+ is 'east' and y+ is 'north' (white moves north)
+# squares falling off the board are cut by the file masks and FULL_BOARD
+def north(bb):
+    return (bb << 8) & FULL_BOARD
+
+
+def south(bb):
+    return bb >> 8
+
+
+def east(bb):
+    return (bb << 1) & NOT_FILE_1 & FULL_BOARD
+
+
+def west(bb):
+    return (bb >> 1) & NOT_FILE_8
+
+
+def north_east(bb):
+    return (bb << 9) & NOT_FILE_1 & FULL_BOARD
+
+
+def north_west(bb):
+    return (bb << 7) & NOT_FILE_8 & FULL_BOARD
+
+
+def south_east(bb):
+    return (bb >> 7) & NOT_FILE_1
+
+
+def south_west(bb):
+    return (bb >> 9) & NOT_FILE_8
+
+
+def pawn_attacks(bb, color):
+    """returns the squares attacked (diagonally forward) by the pawns on bb"""
+    if color == "white":
+        return north_east(bb) | north_west(bb)
+    else:
+        return south_east(bb) | south_west(bb)
+
+
+def knight_attacks(bb):
+    """returns the squares attacked by the knights on bb"""
+    return (((bb << 17) & NOT_FILE_1) | ((bb << 15) & NOT_FILE_8) |
+            ((bb << 10) & NOT_FILE_12) | ((bb << 6) & NOT_FILE_78) |
+            ((bb >> 17) & NOT_FILE_8) | ((bb >> 15) & NOT_FILE_1) |
+            ((bb >> 10) & NOT_FILE_78) | ((bb >> 6) & NOT_FILE_12)) & FULL_BOARD
+
+
+def king_attacks(bb):
+    """returns the squares attacked by the kings on bb"""
+    return (north(bb) | south(bb) | east(bb) | west(bb) |
+            north_east(bb) | north_west(bb) | south_east(bb) | south_west(bb))
+
+
+# Sliding directions as x-y steps, the first four increase the square index (positive), the last four decrease it
+DIRECTIONS = ((0, 1), (1, 0), (1, 1), (-1, 1), (0, -1), (-1, 0), (1, -1), (-1, -1))
+ROOK_DIRECTIONS = (0, 1, 4, 5)
+BISHOP_DIRECTIONS = (2, 3, 6, 7)
+QUEEN_DIRECTIONS = (0, 1, 2, 3, 4, 5, 6, 7)
+
+
+def _build_rays():
+    """RAYS[direction][square]: every square from square (exclusive) to the edge of the board in direction"""
+    rays = []
+    for dx, dy in DIRECTIONS:
+        direction_rays = []
+        for square in range(64):
+            x, y = square % 8 + dx, square // 8 + dy
+            ray = 0
+            while 0 <= x < 8 and 0 <= y < 8:
+                ray |= 1 << (y * 8 + x)
+                x, y = x + dx, y + dy
+            direction_rays.append(ray)
+        rays.append(tuple(direction_rays))
+    return tuple(rays)
+
+
+def _build_between():
+    """BETWEEN[a][b]: the squares strictly between a and b if they share a line or diagonal, else 0"""
+    between = [[0] * 64 for _ in range(64)]
+    for dx, dy in DIRECTIONS:
+        for square in range(64):
+            x, y = square % 8 + dx, square // 8 + dy
+            squares_between = 0
+            while 0 <= x < 8 and 0 <= y < 8:
+                target = y * 8 + x
+                between[square][target] = squares_between
+                squares_between |= 1 << target
+                x, y = x + dx, y + dy
+    return tuple(tuple(row) for row in between)
+
+
+# Lookup tables built once at import
+RAYS = _build_rays()
+BETWEEN = _build_between()
+KNIGHT_ATTACKS = tuple(knight_attacks(1 << square) for square in range(64))
+KING_ATTACKS = tuple(king_attacks(1 << square) for square in range(64))
+PAWN_ATTACKS = {color: tuple(pawn_attacks(1 << square, color) for square in range(64)) for color in COLORS}
+
+
+def ray_attacks(square, occupied, direction):
+    """returns the squares attacked from square in one direction: the ray up to and including the first blocker"""
+    ray = RAYS[direction][square]
+    blockers = ray & occupied
+    if blockers:
+        if direction < 4:
+            # positive direction: the closest blocker is the lowest bit
+            blocker = (blockers & -blockers).bit_length() - 1
+        else:
+            # negative direction: the closest blocker is the highest bit
+            blocker = blockers.bit_length() - 1
+        ray ^= RAYS[direction][blocker]
+    return ray
+
+
+def sliding_attacks(square, occupied, directions):
+    """returns the squares attacked from square along every direction in directions"""
+    attacks = 0
+    for direction in directions:
+        attacks |= ray_attacks(square, occupied, direction)
+    return attacks
+
+
+def rook_attacks(square, occupied):
+    """returns the squares attacked by a rook on square given the occupied squares"""
+    return sliding_attacks(square, occupied, ROOK_DIRECTIONS)
+
+
+def bishop_attacks(square, occupied):
+    """returns the squares attacked by a bishop on square given the occupied squares"""
+    return sliding_attacks(square, occupied, BISHOP_DIRECTIONS)
+
+
+def queen_attacks(square, occupied):
+    """returns the squares attacked by a queen on square given the occupied squares"""
+    return sliding_attacks(square, occupied, QUEEN_DIRECTIONS)
+
+
+def piece_attacks(piece_type, color, square, occupied):
+    """returns the squares attacked by one piece of piece_type and color standing on square"""
+    if piece_type == "pawn":
+        return PAWN_ATTACKS[color][square]
+    elif piece_type == "knight":
+        return KNIGHT_ATTACKS[square]
+    elif piece_type == "king":
+        return KING_ATTACKS[square]
+    elif piece_type == "bishop":
+        return bishop_attacks(square, occupied)
+    elif piece_type == "rook":
+        return rook_attacks(square, occupied)
+    else:
+        return queen_attacks(square, occupied)
+
+
+def other_color(color):
+    return "black" if color == "white" else "white"
+
+
+class BitBoard:
+    """Position core of a Board: one 64-bit occupancy per (color, piece_type) and one per color
+
+    Board keeps it in sync with the pieces' positions, so occupancy, attack and check tests are bitwise operations
+    instead of lookups in Board.cells
+    """
+    def __init__(self):
+        self.pieces = {}
+        self.colors = {}
+        self.occupied = 0
+        self.clear()
+
+    def __repr__(self):
+        rows = []
+        for y in range(8, 0, -1):
+            rows.append(" ".join("x" if (self.occupied >> ((y - 1) * 8 + x - 1)) & 1 else "." for x in range(1, 9)))
+        return "\n".join(rows)
+
+    def clear(self):
+        """empties every bitboard"""
+        self.pieces = {(color, piece_type): 0 for color in COLORS for piece_type in PIECE_TYPES}
+        self.colors = {color: 0 for color in COLORS}
+        self.occupied = 0
+
+    def add(self, color, piece_type, square):
+        """puts a piece of piece_type and color on square"""
+        bit = 1 << square
+        self.pieces[(color, piece_type)] |= bit
+        self.colors[color] |= bit
+        self.occupied |= bit
+
+    def remove(self, color, piece_type, square):
+        """removes a piece of piece_type and color from square"""
+        bit = 1 << square
+        self.pieces[(color, piece_type)] &= ~bit
+        self.colors[color] &= ~bit
+        self.occupied = self.colors["white"] | self.colors["black"]
+
+    def move(self, color, piece_type, from_square, to_square):
+        """moves a piece of piece_type and color from from_square to to_square (captures are not removed here)"""
+        self.remove(color, piece_type, from_square)
+        self.add(color, piece_type, to_square)
+
+    def attackers_to(self, square, color, occupied=None):
+        """returns the bitboard of color's pieces attacking square
+        args:
+        occupied: bitboard, blockers for the sliding pieces (defaults to the current occupancy)
+        """
+        if occupied is None:
+            occupied = self.occupied
+        pieces = self.pieces
+        rooks_queens = pieces[(color, "rook")] | pieces[(color, "queen")]
+        bishops_queens = pieces[(color, "bishop")] | pieces[(color, "queen")]
+        # a pawn of color attacks square if a pawn of the other color on square would attack the pawn
+        attackers = PAWN_ATTACKS[other_color(color)][square] & pieces[(color, "pawn")]
+        attackers |= KNIGHT_ATTACKS[square] & pieces[(color, "knight")]
+        attackers |= KING_ATTACKS[square] & pieces[(color, "king")]
+        if rooks_queens:
+            attackers |= rook_attacks(square, occupied) & rooks_queens
+        if bishops_queens:
+            attackers |= bishop_attacks(square, occupied) & bishops_queens
+        return attackers
+
+    def attacks_by(self, color):
+        """returns every square attacked by at least one piece of color"""
+        occupied = self.occupied
+        pieces = self.pieces
+        attacks = pawn_attacks(pieces[(color, "pawn")], color)
+        attacks |= knight_attacks(pieces[(color, "knight")])
+        attacks |= king_attacks(pieces[(color, "king")])
+        for square in iter_squares(pieces[(color, "rook")] | pieces[(color, "queen")]):
+            attacks |= rook_attacks(square, occupied)
+        for square in iter_squares(pieces[(color, "bishop")] | pieces[(color, "queen")]):
+            attacks |= bishop_attacks(square, occupied)
+        return attacks
@@ -3,7 +3,15 @@ import random
 import time
 import numpy as np
 import itertools
+import collections
 from deep_learning import NeuralNet
+import zobrist
+import evaluation
+from search import Searcher, SearchCounters, aggregate_stats
+from bitboard import (BitBoard, square_index, square_position, iter_squares, pop_count, piece_attacks, sliding_attacks,
+                      rook_attacks, bishop_attacks, BETWEEN, ROOK_DIRECTIONS, BISHOP_DIRECTIONS, QUEEN_DIRECTIONS,
+                      KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, FULL_BOARD,
+                      PROMOTION_ROWS)
 
 # Setting seed for reproducibility
 SEED = 2
@@ -31,8 +39,35 @@ with open("piece_values.pickle", "rb") as f:
 with open("piece_ids.pickle", "rb") as f:
     PIECE_IDS = pickle.load(f)
 
+# Tapered piece-square tables by piece id for scoring many Player.encode_board outputs at once
+PIECE_SQUARE_EVALUATOR = evaluation.PieceSquareEvaluator(PIECE_IDS, PIECE_VALUES)
+
+# x-y cell (key of Board.cells) of every square 0-63, see bitboard.square_index
+SQUARE_CELLS = [(square % 8 + 1, square // 8 + 1) for square in range(64)]
+
+# One move as used by Board.make_move
+# from_square, to_square: 0-63, piece_id: id of the moving piece,
+# capture: id of the captured piece (0 if nothing is captured), promotion: piece type the pawn turns into (or None)
+Move = collections.namedtuple("Move", ["from_square", "to_square", "piece_id", "capture", "promotion"])
+
+# Checks and pins of one player in one position, see Player.pin_analysis
+# checkers: bitboard of the opponent pieces giving check to our king
+# king_targets: squares the king could step to if they were not attacked (not ours, not the opponent's king)
+# targets: squares the other pieces may step to (only capturing the checker or blocking when in check, none in double check)
+# pins: {square of a pinned piece: bitboard of the squares it may step to without leaving the pin line}
+PinAnalysis = collections.namedtuple("PinAnalysis", ["checkers", "king_targets", "targets", "pins"])
+
+# Everything Board.unmake_move needs to restore the position before a move (entries of Board.move_history)
+# piece, old_position, new_position are kept first so a record still reads like the (piece, old_pos, new_pos) step
+UndoState = collections.namedtuple("UndoState", ["piece", "old_position", "new_position", "move", "captured",
+                                                 "captured_index", "promoted", "pawn_index", "attack_state", "key",
+                                                 "evaluation_state", "halfmove_clock"])
+
 
 class Piece:
+    # directions (see bitboard.DIRECTIONS) of the sliding pieces, None for pieces moving one step at a time
+    slide_directions = None
+
     def __init__(self, name, color):
         self.name = name
         self.player = None
@@ -43,10 +78,12 @@ class Piece:
         self.position = STARTING_POSITIONS[(name, color)]
         self.value = PIECE_VALUES[(name, color)]
         self.board = None
-        self.possible_step_directions = None
         self.id = min([item[0] if item[1].__str__() == self.__str__() else 1000 for item in PIECE_IDS])
-        # set_step_directions is implemented in the Pawn, King, Queen, ... classes
-        self.set_step_directions()
+        # Zobrist key of this piece on each square (promoted pieces have their own)
+        self.zobrist_keys = zobrist.piece_keys(self.piece_type, self.color, promoted=self.name.endswith("new"))
+        # middlegame and endgame piece-square values (centi-pawns) of this piece on each square
+        self.square_values_mg = evaluation.piece_square_table(self.piece_type, self.color)
+        self.square_values_eg = evaluation.piece_square_table(self.piece_type, self.color, endgame=True)
 
     def __repr__(self):
         """first letter of self.color + first letter of self.name + last letter of self.name
@@ -68,23 +105,17 @@ class Piece:
         """
         return f"{self.color[0]}_{self.name[0]}{self.name[-1]}"
 
-    @staticmethod
-    def remove_duplicate_positions(list_of_positions):
-        """removes duplicate positions by turning them into a set and back to a list of np.arrays"""
-        if list_of_positions:
-            l = [tuple(item) for item in list_of_positions]
-            l = set(l)
-            l = [np.array(item) for item in l]
-        else:
-            l = []
-        return l
+    @property
+    def square(self):
+        """the square (0-63) of the current position, used to index the board's bitboards"""
+        return square_index(self.position)
 
-    def set_step_directions(self):
-        """Implemented at each piece subclass: see for example Pawn.set_step_directions"""
-        pass
+    def attacks(self):
+        """returns the bitboard of the squares attacked by this piece given the board's current occupancy"""
+        return piece_attacks(self.piece_type, self.color, self.square, self.board.bitboard.occupied)
 
     def move(self, to, remember=True):
-        """moves a piece to a new position (and also )
+        """moves a piece to a new position through Board.make_move (captures and promotes if needed)
         args:
         to: tuple, the new position as a tuple of (x,y) coordinates
         remember: bool, if True appends the move to the move history of self.board (has to be True for the chess bot)
@@ -93,665 +124,74 @@ class Piece:
         self, old_pos, new_pos -- for tracking the steps made during a game
         """
         old_pos = self.position
-        self.position = to
-        move = (self, old_pos, self.position)
-        if remember:
-            self.board.move_history.append(move)
-        return move
-
-    def promote(self, new_position, verbose=False):
-        """Implemented only for Pawn"""
-        pass
-
-    def blocking_check(self, from_piece):
-        """returns if we are blocking check (bool) from a particular piece
-        args:
-        from_piece: Piece instance, would this piece cause a check if we were not at this position
-
-        returns:
-        bool, True if we are blocking a check from 'from_piece' (if we are king we are not blocking check)
-        """
-        positions_in_direction_of_king = from_piece.get_closer_positions_in_direction(self.player.king.position)
-        if self.piece_type == KING_NAME:
-            return False
-        else:
-            if from_piece.piece_type in ("knight", "pawn"):
-                # cannot block a check for a knight or a pawn by their nature
-                return False
-            else:
-                if positions_in_direction_of_king:
-                    # all closer are empty except for us and our king
-                    if sum([0 if self.board.cells[tuple(pos)] is None else 1 for pos in
-                            positions_in_direction_of_king]) == 2:
-
-                        if tuple(self.position) in [tuple(item) for item in positions_in_direction_of_king]:
-                            return True
-                        else:
-                            return False
-                    else:
-                        return False
-                else:
-                    return False
-
-    def get_positions_in_check(self):
-        """get all positions unavailable for the king to step into as one opponent piece keeps it in check"""
-        positions_in_check = []
-        
-        for p in self.opponent.pieces:
-            in_check = p.positions_kept_in_check()
-            
-            if in_check:
-                positions_in_check.extend(in_check)
-
-        positions_in_check = self.remove_duplicate_positions(positions_in_check)
-        return positions_in_check
-
-    def positions_kept_in_check(self):
-        """returns all positions that we (one piece) are keeping in check (not all pieces like get_positions_in_check)"""
-        check_threat = []
-        
-        # if king
-        if self.piece_type == KING_NAME:
-            possible_positions = self.convert_steps_to_positions()
-            for new_position in possible_positions:
-                check_threat.append(new_position)
-
-        # if pawn
-        elif self.piece_type == PAWN_NAMES[0].split(sep="_")[0]:
-            try:
-                self.board.cells[tuple(self.position + self.possible_step_directions['capture_left'][0])]
-                check_threat.append(self.position + self.possible_step_directions['capture_left'][0])
-            except KeyError:
-                pass
-
-            try:
-                self.board.cells[tuple(self.position + self.possible_step_directions['capture_right'][0])]
-                check_threat.append(self.position + self.possible_step_directions['capture_right'][0])
-            except KeyError:
-                pass
-
-        # if knight
-        elif self.piece_type == KNIGHT_NAMES[0].split(sep="_")[0]:
-            check_threat = self.convert_steps_to_positions()
-
-        # if not king, pawn or knight
-        else:
-            possible_positions = self.convert_steps_to_positions()
-
-            for new_position in possible_positions:
-                # if all closer positions to us are also empty
-                closer_positions = self.get_closer_positions_in_direction(new_position)
-                # closer positions is a list but all cells are empty
-                if closer_positions:
-                    if sum([0 if self.board.cells[tuple(pos)] is None else 1 for pos in
-                            closer_positions]) == 0:
-                        check_threat.append(new_position)
-
-                    # strictly closer is empty
-                    elif sum([0 if self.board.cells[tuple(pos)] is None else 1 for pos in
-                              closer_positions][:-1]) == 0:
-
-                        # last is not empty
-                        if [0 if self.board.cells[tuple(pos)] is None else 1 for pos in
-                            closer_positions][-1] == 1:
-                            check_threat.append(new_position)
-
-        check_threat = self.remove_duplicate_positions(check_threat)
-        return check_threat
+        self.board.make_move(self.board.create_move(self, to), remember=remember)
+        return self, old_pos, self.position
 
     def giving_check(self):
         """returns True if the current piece causes check for the opponent's king (else False)"""
-        check_threat = self.positions_kept_in_check()
-        check_threat = [tuple(i) for i in check_threat]
-        if tuple(self.opponent.king.position) in check_threat:
-            return True
-        else:
-            return False
+        return bool((self.attacks() >> self.opponent.king.square) & 1)
 
-    def capture_ability(self, piece):
-        """returns True if the current piece can capture a particular piece of the opponent (else False)
+    def legal_targets(self, analysis):
+        """returns the bitboard of the squares we can legally step to
         args:
-        piece: Piece instance, the opponent's piece we are interested in capturing
-        """
-        legal_moves = self.get_legal_positions()
-        legal_moves = [tuple(item) for item in legal_moves]
-        if tuple(piece.position) in legal_moves:
-            return True
-        else:
-            return False
+        analysis: PinAnalysis of our player in the current position (see Player.pin_analysis)
 
-    def _get_steps_in_direction(self, step):
-        """returns the steps in the direction of a given step, sorted in ascending order (by norm)
-        args:
-        step: np.array, e.g. a normal step for a white pawn is np.array([0,1])
-        
-        example usage:
-        result = Piece("pawn_1", "white")._get_steps_in_direction(step=np.array([0,1])
-        print(result)
-            out: [np.array([0,1]), np.array([0,2])]
-        """
-        steps_in_direction = []
-        possible_directions = list(self.possible_step_directions.keys())
-        # direction: forward-left, backward_left ...
-        for direction in possible_directions:
-            # s: (-1, 1), (-2, 2), (-3, 3) ...
-            step_list = self.possible_step_directions[direction]
-
-            for s in step_list:
-                if np.all(np.sign(s) == np.sign(step)):
-                    steps_in_direction.append(s)
-
-        # sort ascending
-        steps_in_direction = np.array(steps_in_direction)
-        steps_in_direction = steps_in_direction[np.argsort([np.linalg.norm(item) for item in steps_in_direction])]
-        steps_in_direction = steps_in_direction.tolist()
-        steps_in_direction = [np.array(elem) for elem in steps_in_direction]
-        return steps_in_direction
-
-    def get_positions_in_direction(self, position):
-        """returns positions (only the ones on the board!) in the direction of a given position, sorted ascending
-        returns empty list if no positions in that direction
+        sliding pieces (bishop, rook, queen) are handled here, Pawn, Knight and King override it
         """
-        positions_in_direction = []
-        # calculate direction in terms of an imagined step
-        imaginary_step = position - self.position
+        square = self.square
+        attacks = sliding_attacks(square, self.board.bitboard.occupied, self.slide_directions)
+        return attacks & analysis.targets & analysis.pins.get(square, FULL_BOARD)
 
-        # steps in direction is sorted from smallest step to largest
-        steps_in_direction = self._get_steps_in_direction(imaginary_step)
 
-        for step in steps_in_direction:
-            try:
-                new_position = self.position + step
-                cell_content = self.board.cells[tuple(new_position)]
-                positions_in_direction.append(new_position)
-            except KeyError:
-                # out of bounds
-                pass
-        return positions_in_direction
-
-    def convert_steps_to_positions(self):
-        """returns all positions for the current piece, including unavailable ones
-        (uses the piece's natural step directions and its current position)
-        """
-        new_positions = []
-
-        # direction is forward_right, backward_right ...
-        possible_directions = list(self.possible_step_directions.keys())
-        for direction in possible_directions:
-            for step in self.possible_step_directions[direction]:
-                new_position = self.position + step
-                # on the board
-                try:
-                    cell_content = self.board.cells[tuple(new_position)]
-                    new_positions.append(new_position)
-
-                except KeyError:
-                    # out-of-bound step
-                    pass
-
-        return new_positions
-
-    def get_closer_positions_in_direction(self, position):
-        """returns positions which are in the direction of position but are closer-equal (inclusive) to us
-        only considers positions which are on the board
-        returns an empty list if there are no positions in that direction
+class Pawn(Piece):
+    def promotion_type(self, to_square):
+        """returns the piece type we turn into when stepping to to_square (None if it is not a promotion)
+        the first one missing from: one queen, two rooks, two bishops, two knights
+        if none of them is missing the pawn stays a pawn on the last row
         """
-        closer_positions = []
-        positions_in_direction = self.get_positions_in_direction(position)
-        new_position_distance = np.linalg.norm(position - self.position)
-
-        if positions_in_direction:
-            for pos in positions_in_direction:
-                if np.linalg.norm(pos - self.position) <= new_position_distance:
-                    closer_positions.append(pos)
-
-            # sort ascending
-            closer_positions = np.array(closer_positions)
-            closer_positions = closer_positions[
-                np.argsort([np.linalg.norm(item - self.position) for item in closer_positions])]
-            closer_positions = closer_positions.tolist()
-            closer_positions = [np.array(elem) for elem in closer_positions]
-            return closer_positions
-        else:
-            return closer_positions
-
-    def get_legal_positions(self):
-        """returns currently available positions (to which we can actually move)
-        if a position is not returned by this function the chess bot won't be able to step there
-         """
-
-        legal_moves = []
-        check_threat = []
-
-        # our king is in check
-        if self.player.king.king_in_check():
-
-            # we are the king so we have to step out of check or capture
-            if self.player.king == self:
-                positions_in_check = self.get_positions_in_check()
-                positions_in_check = [tuple(item) for item in positions_in_check]
-                possible_positions = self.convert_steps_to_positions()
-
-                for pos in possible_positions:
-                    # if a position is not in check
-                    if tuple(pos) not in positions_in_check:
-                        # if it is empty -- legal_move
-                        if self.board.cells[tuple(pos)] is None:
-                            legal_moves.append(pos)
-                        # if it has an opponent on it -- legal_move
-                        elif self.board.cells[tuple(pos)].player == self.opponent:
-                            legal_moves.append(pos)
-                # see if we can capture it
-                piece_causing_check = self.opponent.piece_giving_check()
-                if tuple(piece_causing_check.position) in [tuple(item) for item in possible_positions]:
-                    legal_moves.append(piece_causing_check.position)
-
-                legal_moves = self.remove_duplicate_positions(legal_moves)
-                return legal_moves
-
-            # we are not the king
-            else:
-                # if we are blocking another check -- we can't move
-                for opp_piece in self.opponent.pieces:
-                    if self.blocking_check(from_piece=opp_piece):
-                        return legal_moves
-
-                # if we are not blocking another check -- we can move in between the attacker and the king or capture
-                possible_positions = self.convert_steps_to_positions()
-                possible_positions = [tuple(item) for item in possible_positions]
-                piece_causing_check = self.opponent.piece_giving_check()
-                # see if we can capture it
-                if tuple(piece_causing_check.position) in possible_positions:
-
-                    if self.piece_type == "pawn":
-                        capture_right_pos = tuple(self.position + self.possible_step_directions["capture_right"][0])
-                        capture_left_pos = tuple(self.position + self.possible_step_directions["capture_left"][0])
-
-                        if tuple(piece_causing_check.position) in (capture_right_pos, capture_left_pos):
-                            legal_moves.append(piece_causing_check.position)
-
-                    elif self.piece_type == "knight":
-                        if tuple(piece_causing_check.position) in possible_positions:
-                            legal_moves.append(piece_causing_check.position)
-                    else:
-                        closer_positions = self.get_closer_positions_in_direction(piece_causing_check.position)
-                        # strictly closer is empty
-                        if sum([0 if self.board.cells[tuple(pos)] is None else 1 for pos in
-                                  closer_positions][:-1]) == 0:
-                            legal_moves.append(piece_causing_check.position)
-
-                # if it is a rook, queen, bishop -- we can move in between
-                if piece_causing_check.piece_type in ("rook", "queen", "bishop"):
-                    in_between_positions = piece_causing_check.get_closer_positions_in_direction(
-                        self.player.king.position)
-
-                    #  in_between_positions is not an empty list
-                    if in_between_positions:
-                        in_between_positions = [tuple(item) for item in in_between_positions]
-
-                        # pawn
-                        if self.piece_type == "pawn":
-                            capture_right_pos = tuple(
-                                self.position + self.possible_step_directions["capture_right"][0])
-                            capture_left_pos = tuple(self.position + self.possible_step_directions["capture_left"][0])
-
-                            for pos in possible_positions:
-                                if tuple(pos) in in_between_positions:
-                                    if tuple(pos) not in (capture_right_pos, capture_left_pos):
-                                        legal_moves.append(pos)
-
-                        # knight
-                        elif self.piece_type == "knight":
-                            for pos in possible_positions:
-                                if tuple(pos) in in_between_positions:
-                                    legal_moves.append(pos)
-
-                        else:
-
-                            for pos in possible_positions:
-                                if tuple(pos) in in_between_positions:
-
-                                    closer_positions = self.get_closer_positions_in_direction(pos)
-                                    count_non_empty = \
-                                        sum([0 if self.board.cells[tuple(p)] is None else 1 for p in closer_positions])
-                                    if count_non_empty == 0:
-                                        legal_moves.append(piece_causing_check.position)
-                                    elif count_non_empty == 1:
-                                        if tuple(pos) == tuple(piece_causing_check.position):
-                                            legal_moves.append(pos)
-
-                    # in_between_positions is an empty list []
-                    else:
-                        pass
-
-                legal_moves = self.remove_duplicate_positions(legal_moves)
-                return legal_moves
-
-        # our king is not in check
-        else:
-            possible_positions = self.convert_steps_to_positions()
-            possible_positions = self.remove_duplicate_positions(possible_positions)
-
-            # if we are king
-            if self.piece_type == "king":
-                positions_in_check = self.get_positions_in_check()
-                positions_in_check = [tuple(item) for item in positions_in_check]
-
-                for pos in possible_positions:
-
-                    # the position is not in check
-                    if tuple(pos) not in positions_in_check:
-
-                        # position is empty
-                        if self.board.cells[tuple(pos)] is None:
-                            legal_moves.append(pos)
-                            check_threat.append(pos)
-
-                        # opponent's piece
-                        elif self.board.cells[tuple(pos)].player is self.opponent:
-                            legal_moves.append(pos)
-                            check_threat.append(pos)
-
-                        # our piece
-                        elif self.board.cells[tuple(pos)].player is self.player:
-                            check_threat.append(pos)
-                        else:
-                            raise ValueError("Something does not work with if, elif, elif")
-
-            # we are not king
-            else:
-
-                for new_position in possible_positions:
-                    cell_content = self.board.cells[tuple(new_position)]
-                    # cell is empty
-                    if cell_content is None:
-
-                        # pawn
-                        if self.piece_type == "pawn":
-                            capture_right_pos = tuple(self.position + self.possible_step_directions["capture_right"][0])
-                            capture_left_pos = tuple(self.position + self.possible_step_directions["capture_left"][0])
-
-
-                            # we are not trying to capture an empty cell
-                            if tuple(new_position) not in (capture_right_pos, capture_left_pos):
-                                legal_moves.append(new_position)
-
-                        # knight
-                        elif self.piece_type == "knight":
-                            check_threat.append(new_position)
-                            legal_moves.append(new_position)
-
-                        # rook, queen, bishop
-                        else:
-                            # if all closer positions to us are also empty
-                            closer_positions = self.get_closer_positions_in_direction(new_position)
-
-                            # closer positions is a list but all cells are empty
-                            if closer_positions:
-                                if sum([0 if self.board.cells[tuple(pos)] is None else 1 for pos in
-                                        closer_positions]) == 0:
-                                    legal_moves.append(new_position)
-
-                            # strictly closer is empty
-                            elif sum([0 if self.board.cells[tuple(pos)] is None else 1 for pos in
-                                      closer_positions][:-1]) == 0:
-
-                                # equal is not empty
-                                if [0 if self.board.cells[tuple(pos)] is None else 1 for pos in
-                                    closer_positions][-1] == 1:
-                                    legal_moves.append(new_position)
-
-                    # opponent's piece
-                    elif cell_content.player is self.opponent:
-
-                        # pawn
-                        if self.piece_type == "pawn":
-                            capture_right_pos = tuple(self.position + self.possible_step_directions["capture_right"][0])
-                            capture_left_pos = tuple(self.position + self.possible_step_directions["capture_left"][0])
-
-                            # if new_pos is not straight ahead -- legal move and check threat
-                            if tuple(new_position) in (capture_right_pos, capture_left_pos):
-                                legal_moves.append(new_position)
-
-                        # knight
-                        elif self.piece_type == "knight":
-
-                            legal_moves.append(new_position)
-
-                        # rook, queen, bishop
-                        else:
-                            closer_positions = self.get_closer_positions_in_direction(new_position)
-
-                            # closer positions is a list
-                            if closer_positions:
-                                #  if all closer positions to us are empty
-                                if sum([0 if self.board.cells[tuple(pos)] is None else 1 for pos in
-                                        closer_positions]) == 0:
-
-                                    legal_moves.append(new_position)
-
-                                # strictly closer is empty
-                                elif sum([0 if self.board.cells[tuple(pos)] is None else 1 for pos in
-                                          closer_positions][:-1]) == 0:
-
-                                    # equal is not empty
-                                    if [0 if self.board.cells[tuple(pos)] is None else 1 for pos in
-                                        closer_positions][-1] == 1:
-                                        legal_moves.append(new_position)
-
-                                # not all closer positions are empty
-                                else:
-                                    pass
-
-                    # own piece standing there
-                    else:
-                        pass
-
-                    # See if we are blocking check
-                    # blocking check already considers that we are the only ones blocking the king from them
-                    for opp_piece in self.opponent.pieces:
-
-                        # if check is given by rook, queen, bishop -- we can step closer or remove
-                        if self.blocking_check(from_piece=opp_piece):
-                            possible_positions = self.convert_steps_to_positions()
-                            possible_positions = self.remove_duplicate_positions(possible_positions)
-                            legal_moves = []    # empty legal_moves since we can only move this way now
-
-                            for new_position in possible_positions:
-                                # pawn
-                                if self.piece_type == "pawn":
-
-                                    capture_right_pos = tuple(self.position + self.possible_step_directions["capture_right"][0])
-                                    capture_left_pos = tuple(self.position + self.possible_step_directions["capture_left"][0])
-
-                                    # if new_pos is not straight ahead -- legal move and check threat
-                                    if tuple(new_position) in (capture_right_pos, capture_left_pos):
-                                        if tuple(opp_piece.position) == tuple(new_position):
-                                            legal_moves.append(new_position)
-                                    else:
-                                        in_between_positions = self.get_closer_positions_in_direction(opp_piece.position)
-
-                                        in_between_positions = [tuple(item) for item in in_between_positions]
-                                        if tuple(new_position) in in_between_positions:
-                                            if self.board.cells[tuple(new_position)] is None:
-                                                legal_moves.append(new_position)
-
-                                # rook, queen, bishop, knight
-                                else:
-                                    positions_in_direction_of_check = \
-                                        self.get_closer_positions_in_direction(opp_piece.position)
-                                    positions_in_direction_of_check = [tuple(item) for item in
-                                                                       positions_in_direction_of_check]
-
-                                    if tuple(new_position) in positions_in_direction_of_check:
-                                        legal_moves.append(new_position)
-                        else:
-                            # we are not blocking check from that opp_piece
-                            pass
-
-        legal_moves = self.remove_duplicate_positions(legal_moves)
-        return legal_moves
-
+        last_row = 7 if self.color == "white" else 0
+        if to_square // 8 != last_row:
+            return None
+        return self.player.promotion_type()
 
-class Pawn(Piece):
-    def set_step_directions(self):
-        self.white_steps = {
-            'normal_step': [np.array([0, 1])],
-            'capture_right': [np.array([1, 1])],
-            'capture_left': [np.array([-1, 1])],
-            'initial_long_step': [np.array([0, 2])]
-        }
-        self.black_steps = {
-            'normal_step': [np.array([0, -1])],
-            'capture_right': [np.array([-1, -1])],
-            'capture_left': [np.array([1, -1])],
-            'initial_long_step': [np.array([0, -2])]
-        }
-        self.possible_step_directions = self.white_steps if self.color == "white" else self.black_steps
-
-    def promote(self, new_position, verbose=False):
-        active_player = self.board.player_1 if self.color == self.board.player_1.color else self.board.player_2
+    def legal_targets(self, analysis):
+        """returns the bitboard of the squares we can legally step to (one or two steps forward, or capture)"""
+        square = self.square
+        bitboard = self.board.bitboard
+        occupied = bitboard.occupied
         if self.color == "white":
-            if tuple(new_position) in [(1, 8), (2, 8), (3, 8), (4, 8), (5, 8), (6, 8), (7, 8), (8, 8)]:
-                pass
-            else:
-                return 0
-
+            forward, second_row = 8, 1
         else:
-            if tuple(new_position) in [(1, 1), (2, 1), (3, 1), (4, 1), (5, 1), (6, 1), (7, 1), (8, 1)]:
-                pass
-            else:
-                return 0
-
-        active_player_picece_types = [p.piece_type for p in active_player.pieces]
-        if active_player_picece_types.count("queen") == 0:
-            active_player.pop_piece(self, verbose)
-            active_player.pieces.append(Queen(name="queen_new", color=active_player.color))
-
-        elif active_player_picece_types.count("rook") in (0, 1):
-            active_player.pop_piece(self, verbose)
-            active_player.pieces.append(Rook(name="rook_new", color=active_player.color))
+            forward, second_row = -8, 6
 
-        elif active_player_picece_types.count("bishop") in (0, 1):
-            active_player.pop_piece(self, verbose)
-            active_player.pieces.append(Bishop(name="bishop_new", color=active_player.color))
-
-        elif active_player_picece_types.count("knight") in (0, 1):
-            active_player.pop_piece(self, verbose)
-            active_player.pieces.append(Knight(name="knight_new", color=active_player.color))
-        else:
-            # do not remove current pawn
-            pass
-
-        for p in active_player.pieces:
-            if p.name.endswith("new"):
-                if tuple(p.position) == (0, 0):
-                    p.position = new_position
-                    p.board = active_player.board
-                    p.player = active_player
-                    p.opponent = active_player.opponent
-
-    def convert_steps_to_positions(self):
-        """returns all positions for the current piece, including unavailable ones"""
-        available_new_positions = []
-        # We can move forward ONE cell if that cell is empty and we are not blocking a check currently
-        try:
-            if self.board.cells[tuple(self.position + self.possible_step_directions['normal_step'][0])] is None:
-                for opp_piece in self.opponent.pieces:
-                    if not self.blocking_check(from_piece=opp_piece):
-                        available_new_positions.append(self.position + self.possible_step_directions['normal_step'][0])
-        except KeyError:
-            pass
-
-        # We can capture RIGHT if the opponents piece is there and we are not blocking check currently
-        try:
-            if self.board.cells[tuple(self.position + self.possible_step_directions['capture_right'][0])] is not None:
-                if self.board.cells[
-                    tuple(self.position + self.possible_step_directions['capture_right'][0])].color != self.color:
-                    for opp_piece in self.opponent.pieces:
-                        if not self.blocking_check(from_piece=opp_piece):
-                            available_new_positions.append(
-                                self.position + self.possible_step_directions['capture_right'][0])
-        except KeyError:
-            pass
-
-        # We can capture LEFT if the opponents piece is there and we are not blocking check currently
-        try:
-            if self.board.cells[tuple(self.position + self.possible_step_directions['capture_left'][0])] is not None:
-                if self.board.cells[
-                    tuple(self.position + self.possible_step_directions['capture_left'][0])].color != self.color:
-                    for opp_piece in self.opponent.pieces:
-                        if not self.blocking_check(from_piece=opp_piece):
-                            available_new_positions.append(
-                                self.position + self.possible_step_directions['capture_left'][0])
-        except KeyError:
-            pass
-
-        # We can move forward TWO cells if that cell is empty, we haven't moved yet and we are not blocking a check currently
-        try:
-            if self.board.cells[tuple(self.position + self.possible_step_directions['initial_long_step'][0])] is None:
-                if self.board.cells[tuple(self.position + self.possible_step_directions['normal_step'][0])] is None:
-                    if np.all(self.position == self.starting_position):
-                        for opp_piece in self.opponent.pieces:
-                            if not self.blocking_check(from_piece=opp_piece):
-                                available_new_positions.append(
-                                    self.position + self.possible_step_directions['initial_long_step'][0])
-        except KeyError:
-            pass
-        return available_new_positions
+        targets = PAWN_ATTACKS[self.color][square] & bitboard.colors[self.opponent.color]
+        one_step = square + forward
+        if 0 <= one_step < 64 and not (occupied >> one_step) & 1:
+            targets |= 1 << one_step
+            two_steps = one_step + forward
+            # a pawn on its second row has not moved yet
+            if square // 8 == second_row and not (occupied >> two_steps) & 1:
+                targets |= 1 << two_steps
+        return targets & analysis.targets & analysis.pins.get(square, FULL_BOARD)
 
 
 class King(Piece):
-    def set_step_directions(self):
-        self.white_steps = {
-            'forward': np.array([0, 1]),
-            'forward_right': np.array([1, 1]),
-            'forward_left': np.array([-1, 1]),
-            'right': np.array([1, 0]),
-            'left': np.array([-1, 0]),
-            'backward': np.array([0, -1]),
-            'backward_right': np.array([1, -1]),
-            'backward_left': np.array([-1, -1])
-        }
-        self.black_steps = {
-            'forward': np.array([0, -1]),
-            'forward_right': np.array([-1, -1]),
-            'forward_left': np.array([1, -1]),
-            'right': np.array([-1, 0]),
-            'left': np.array([1, 0]),
-            'backward': np.array([0, 1]),
-            'backward_right': np.array([-1, 1]),
-            'backward_left': np.array([1, 1])
-        }
-        self.possible_step_directions = self.white_steps if self.color == "white" else self.black_steps
-
-    def convert_steps_to_positions(self):
-        """converts steps to positions using: current_position + step for step in possible_steps"""
+    def legal_targets(self, analysis):
+        """returns the bitboard of the squares we can legally step to: not attacked once we left our square"""
         # castling not implemented yet !!
-
-        new_positions = []
-        step_directions = list(self.possible_step_directions.values())
-
-        for direction in step_directions:
-            new_position = self.position + direction
-            # on the board
-            try:
-                cell_content = self.board.cells[tuple(new_position)]
-                new_positions.append(new_position)
-            except KeyError:
-                # out-of-bound step
-                pass
-
-        return new_positions
+        square = self.square
+        bitboard = self.board.bitboard
+        opponent_color = self.opponent.color
+        without_king = bitboard.occupied ^ (1 << square)
+        targets = 0
+        for to_square in iter_squares(KING_ATTACKS[square] & analysis.king_targets):
+            if not bitboard.attackers_to(to_square, opponent_color, without_king):
+                targets |= 1 << to_square
+        return targets
 
     def king_in_check(self):
         """returns True if we are in check, else False"""
-        positions_in_check = self.get_positions_in_check()
-        positions_in_check = [tuple(item) for item in positions_in_check]
-        if tuple(self.position) in positions_in_check:
-            return True
-        else:
-            return False
+        return bool(self.player.checkers)
 
     def other_king_distance(self, from_position):
         """returns the distance from the other player's king
@@ -770,167 +210,60 @@ class King(Piece):
 
 
 class Bishop(Piece):
-    def set_step_directions(self):
-        self.white_steps = {
-            'forward_right': [np.array([1, 1]), np.array([2, 2]), np.array([3, 3]), np.array([4, 4]),
-                              np.array([5, 5]), np.array([6, 6]), np.array([7, 7])],
-
-            'forward_left': [np.array([-1, 1]), np.array([-2, 2]), np.array([-3, 3]), np.array([-4, 4]),
-                             np.array([-5, 5]), np.array([-6, 6]), np.array([-7, 7])],
-
-            'backward_right': [np.array([1, -1]), np.array([2, -2]), np.array([3, -3]), np.array([4, -4]),
-                               np.array([5, -5]), np.array([6, -6]), np.array([7, -7])],
-
-            'backward_left': [np.array([-1, -1]), np.array([-2, -2]), np.array([-3, -3]), np.array([-4, -4]),
-                              np.array([-5, -5]), np.array([-6, -6]), np.array([-7, -7])]
-        }
-        self.black_steps = {
-            'forward_right': [np.array([-1, -1]), np.array([-2, -2]), np.array([-3, -3]), np.array([-4, -4]),
-                              np.array([-5, -5]), np.array([-6, -6]), np.array([-7, -7])],
-
-            'forward_left': [np.array([1, -1]), np.array([2, -2]), np.array([3, -3]), np.array([4, -4]),
-                             np.array([5, -5]), np.array([6, -6]), np.array([7, -7])],
-
-            'backward_right': [np.array([-1, 1]), np.array([-2, 2]), np.array([-3, 3]), np.array([-4, 4]),
-                               np.array([-5, 5]), np.array([-6, 6]), np.array([-7, 7])],
-
-            'backward_left': [np.array([1, 1]), np.array([2, 2]), np.array([3, 3]), np.array([4, 4]),
-                              np.array([5, 5]), np.array([6, 6]), np.array([7, 7])],
-        }
-
-        self.possible_step_directions = self.white_steps if self.color == "white" else self.black_steps
+    slide_directions = BISHOP_DIRECTIONS
 
 
 class Rook(Piece):
-    def set_step_directions(self):
-        self.white_steps = {
-            'forward': [np.array([0, 1]), np.array([0, 2]), np.array([0, 3]), np.array([0, 4]),
-                        np.array([0, 5]), np.array([0, 6]), np.array([0, 7])],
-            'backward': [np.array([0, -1]), np.array([0, -2]), np.array([0, -3]), np.array([0, -4]),
-                         np.array([0, -5]), np.array([0, -6]), np.array([0, -7])],
-            'right': [np.array([1, 0]), np.array([2, 0]), np.array([3, 0]), np.array([4, 0]),
-                      np.array([5, 0]), np.array([6, 0]), np.array([7, 0])],
-            'left': [np.array([-1, 0]), np.array([-2, 0]), np.array([-3, 0]), np.array([-4, 0]),
-                     np.array([-5, 0]), np.array([-6, 0]), np.array([-7, 0])]
-        }
-        self.black_steps = {
-            'forward': [np.array([0, -1]), np.array([0, -2]), np.array([0, -3]), np.array([0, -4]),
-                        np.array([0, -5]), np.array([0, -6]), np.array([0, -7])],
-            'backward': [np.array([0, 1]), np.array([0, 2]), np.array([0, 3]), np.array([0, 4]),
-                         np.array([0, 5]), np.array([0, 6]), np.array([0, 7])],
-            'right': [np.array([-1, 0]), np.array([-2, 0]), np.array([-3, 0]), np.array([-4, 0]),
-                      np.array([-5, 0]), np.array([-6, 0]), np.array([-7, 0])],
-            'left': [np.array([1, 0]), np.array([2, 0]), np.array([3, 0]), np.array([4, 0]),
-                     np.array([5, 0]), np.array([6, 0]), np.array([7, 0])]
-        }
-
-        self.possible_step_directions = self.white_steps if self.color == "white" else self.black_steps
+    slide_directions = ROOK_DIRECTIONS
 
 
 class Queen(Piece):
-    def set_step_directions(self):
-        self.white_steps = {
-            'forward': [np.array([0, 1]), np.array([0, 2]), np.array([0, 3]), np.array([0, 4]),
-                        np.array([0, 5]), np.array([0, 6]), np.array([0, 7])],
-            'backward': [np.array([0, -1]), np.array([0, -2]), np.array([0, -3]), np.array([0, -4]),
-                         np.array([0, -5]), np.array([0, -6]), np.array([0, -7])],
-            'right': [np.array([1, 0]), np.array([2, 0]), np.array([3, 0]), np.array([4, 0]),
-                      np.array([5, 0]), np.array([6, 0]), np.array([7, 0])],
-            'left': [np.array([-1, 0]), np.array([-2, 0]), np.array([-3, 0]), np.array([-4, 0]),
-                     np.array([-5, 0]), np.array([-6, 0]), np.array([-7, 0])],
-            'forward_right': [np.array([1, 1]), np.array([2, 2]), np.array([3, 3]), np.array([4, 4]),
-                              np.array([5, 5]), np.array([6, 6]), np.array([7, 7])],
-            'forward_left': [np.array([-1, 1]), np.array([-2, 2]), np.array([-3, 3]), np.array([-4, 4]),
-                             np.array([-5, 5]), np.array([-6, 6]), np.array([-7, 7])],
-            'backward_right': [np.array([1, -1]), np.array([2, -2]), np.array([3, -3]), np.array([4, -4]),
-                               np.array([5, -5]), np.array([6, -6]), np.array([7, -7])],
-            'backward_left': [np.array([-1, -1]), np.array([-2, -2]), np.array([-3, -3]), np.array([-4, -4]),
-                              np.array([-5, -5]), np.array([-6, -6]), np.array([-7, -7])]
-        }
-        self.black_steps = {
-            'forward': [np.array([0, -1]), np.array([0, -2]), np.array([0, -3]), np.array([0, -4]),
-                        np.array([0, -5]), np.array([0, -6]), np.array([0, -7])],
-            'backward': [np.array([0, 1]), np.array([0, 2]), np.array([0, 3]), np.array([0, 4]),
-                         np.array([0, 5]), np.array([0, 6]), np.array([0, 7])],
-            'right': [np.array([-1, 0]), np.array([-2, 0]), np.array([-3, 0]), np.array([-4, 0]),
-                      np.array([-5, 0]), np.array([-6, 0]), np.array([-7, 0])],
-            'left': [np.array([1, 0]), np.array([2, 0]), np.array([3, 0]), np.array([4, 0]),
-                     np.array([5, 0]), np.array([6, 0]), np.array([7, 0])],
-            'forward_right': [np.array([-1, -1]), np.array([-2, -2]), np.array([-3, -3]), np.array([-4, -4]),
-                              np.array([-5, -5]), np.array([-6, -6]), np.array([-7, -7])],
-            'forward_left': [np.array([1, -1]), np.array([2, -2]), np.array([3, -3]), np.array([4, -4]),
-                             np.array([5, -5]), np.array([6, -6]), np.array([7, -7])],
-            'backward_right': [np.array([-1, 1]), np.array([-2, 2]), np.array([-3, 3]), np.array([-4, 4]),
-                               np.array([-5, 5]), np.array([-6, 6]), np.array([-7, 7])],
-            'backward_left': [np.array([1, 1]), np.array([2, 2]), np.array([3, 3]), np.array([4, 4]),
-                              np.array([5, 5]), np.array([6, 6]), np.array([7, 7])]
-        }
-
-        self.possible_step_directions = self.white_steps if self.color == "white" else self.black_steps
+    slide_directions = QUEEN_DIRECTIONS
 
 
 class Knight(Piece):
-    def set_step_directions(self):
-        self.white_steps = {
-            'forward_right': np.array([1, 2]),
-            'backward_right': np.array([1, -2]),
-            'forward_left': np.array([-1, 2]),
-            'backward_left': np.array([-1, -2]),
-            'right_forward': np.array([2, 1]),
-            'left_forward': np.array([-2, 1]),
-            'right_backward': np.array([2, -1]),
-            'left_backward': np.array([-2, -1])
-        }
-        self.black_steps = {
-            'forward_right': np.array([-1, -2]),
-            'backward_right': np.array([-1, 2]),
-            'forward_left': np.array([1, -2]),
-            'backward_left': np.array([1, 2]),
-            'right_forward': np.array([-2, -1]),
-            'left_forward': np.array([2, -1]),
-            'right_backward': np.array([-2, 1]),
-            'left_backward': np.array([2, 1])
-        }
-
-        self.possible_step_directions = self.white_steps if self.color == "white" else self.black_steps
-
-    def convert_steps_to_positions(self):
-        """returns all positions for the current piece, including unavailable ones"""
-
-        available_new_positions = []
-        check_threat = []
-
-        # direction is forward_right, backward_right ...
-        for direction in self.possible_step_directions.keys():
-            # new_position: the position we are examining
-            new_position = self.position + self.possible_step_directions[direction]
-            # on the board
-            try:
-                # empty
-                if self.board.cells[tuple(new_position)] is None:
-                    available_new_positions.append(new_position)
-
-                # not empty
-                else:
-                    # other player's piece
-                    if self.board.cells[tuple(new_position)].color != self.color:
-                        available_new_positions.append(new_position)
-
-                    # our piece -- append to positions_kept_in_check
-                    else:
-                        check_threat.append(new_position)
-
-            except KeyError:
-                # out-of-bound step
-                pass
-
-        return available_new_positions
+    def legal_targets(self, analysis):
+        """returns the bitboard of the squares we can legally step to (a pinned knight can never move)"""
+        square = self.square
+        if square in analysis.pins:
+            return 0
+        return KNIGHT_ATTACKS[square] & analysis.targets
+
+
+# Piece classes a pawn can be promoted to, see Pawn.promotion_type
+PROMOTION_CLASSES = {"queen": Queen, "rook": Rook, "bishop": Bishop, "knight": Knight}
+# Piece.value of the piece a pawn turns into by (Move.promotion, color), for the move ordering of the search
+PROMOTION_VALUES = {(piece_type, color): PIECE_VALUES[(f"{piece_type}_new", color)]
+                    for piece_type in PROMOTION_CLASSES for color in ("white", "black")}
+
+# Game status of the player to move, see Board.game_status
+ONGOING = "ongoing"
+CHECK = "check"
+CHECKMATE = "checkmate"
+STALEMATE = "stalemate"
+# Board.game_status remembers this many positions before starting over
+STATUS_CACHE_SIZE = 100000
+# Draw rules: the same position (and side to move) for the third time, or 50 moves of each player without a capture
+# or a pawn step
+REPETITIONS = 3
+FIFTY_MOVE_PLIES = 100
+
+# Adjudication of self-play games in Board.play, scores are evaluation.evaluate in piece value units (a pawn is 1)
+# resign_threshold, resign_plies: the side behind by at least resign_threshold for resign_plies plies in a row resigns
+# draw_after_ply, draw_max_pieces, draw_threshold, draw_plies: from ply draw_after_ply, with at most draw_max_pieces
+#   pieces left, a score within +-draw_threshold for draw_plies plies in a row is a draw
+Adjudication = collections.namedtuple("Adjudication", ["resign_threshold", "resign_plies", "draw_after_ply",
+                                                       "draw_max_pieces", "draw_threshold", "draw_plies"],
+                                      defaults=[10, 10, 80, 8, 0.5, 10])
 
 
 class Player:
-    def __init__(self, color, engine, id=None, max_depth=None, model_path=None, kernel_initializer='glorot_uniform'):
+    def __init__(self, color, engine, id=None, max_depth=None, model_path=None, kernel_initializer='glorot_uniform',
+                 search="minimax", time_limit_ms=None, node_limit=None, tt_size_mb=16, search_options=None, book=None):
         self.color = color
         self.engine = engine
+        # opening_book.OpeningBook the robot and ai play from until out of book (None: no book)
+        self.book = book
         self.id = id
         self.elo_score = 1400
         self.opponent = None
@@ -943,6 +276,16 @@ class Player:
         self.pieces = self.pawns + self.bishops + self.knights + self.rooks + [self.king] + [self.queen]
         self.active = False
         self.board = None
+        # opponent pieces giving check to our king and the bitboard of the squares we attack (None until needed),
+        # both maintained by Board.make_move / Board.unmake_move
+        self.checkers = []
+        self._attacks = None
+        self._pin_analysis = None
+        # running totals of the evaluation: summed piece values and piece-square values (centi-pawns) of our pieces,
+        # set by Board.update_board and kept by Board.make_move / Board.unmake_move
+        self.material = 0
+        self.positional_mg = 0
+        self.positional_eg = 0
         self.steps_encoded = self.encode_all_steps()
 
         # Verifying other arguments of engine
@@ -950,11 +293,27 @@ class Player:
             raise ValueError("engine should be one of: 0,1,2,human, robot, ai")
         else:
             # Robot: forward looking
+            # search="minimax": exhaustive look_forward, max_depth=0 looks 1 step ahead
+            # search="alphabeta": negamax with alpha-beta pruning (search.Searcher), max_depth is the number of steps
+            #   deepening step by step until max_depth or until time_limit_ms / node_limit per move runs out,
+            #   with a transposition table of tt_size_mb megabytes (0: none),
+            #   search_options: dict of further keyword arguments of Searcher (e.g. {"quiescence": False})
             if self.engine == "robot" or self.engine == 1:
-                if max_depth not in (0, 1, 2, "adaptive"):
-                    raise ValueError("Invalid max_depth for {self.color}. Choose one of: 0,1,2,'adaptive'.")
+                self.search = search
+                if search == "minimax":
+                    if max_depth not in (0, 1, 2, "adaptive"):
+                        raise ValueError(f"Invalid max_depth for {self.color}. Choose one of: 0,1,2,'adaptive'.")
+                elif search == "alphabeta":
+                    if max_depth is None and time_limit_ms is None and node_limit is None:
+                        raise ValueError(f"Give max_depth, time_limit_ms or node_limit for {self.color}.")
+                    if max_depth is not None and (not isinstance(max_depth, int) or max_depth < 1):
+                        raise ValueError(f"Invalid max_depth for {self.color}. Choose a positive integer.")
+                    self.searcher = Searcher(self, time_limit_ms=time_limit_ms, node_limit=node_limit,
+                                             tt_size_mb=tt_size_mb, promotion_values=PROMOTION_VALUES,
+                                             **(search_options or {}))
                 else:
-                    self.max_depth = max_depth
+                    raise ValueError("search should be one of: minimax, alphabeta")
+                self.max_depth = max_depth
 
             # AI: neural net
             elif self.engine == "ai" or self.engine == 2:
@@ -983,12 +342,10 @@ class Player:
     def encode_legal_steps(self):
         """creates an encoding of (x,y,id) for legal positions combined with piece.id in available pieces"""
         legal_steps_encoded = []
-        for p in self.pieces:
-            legal_pos = p.get_legal_positions()
-            if legal_pos:
-                for pos in legal_pos:
-                    step_encoded = int(str(pos[0]) + str(pos[1]) + str(p.id))
-                    legal_steps_encoded.append(step_encoded)
+        for move in self.generate_legal_moves():
+            x, y = SQUARE_CELLS[move.to_square]
+            step_encoded = int(str(x) + str(y) + str(move.piece_id))
+            legal_steps_encoded.append(step_encoded)
 
         return legal_steps_encoded
 
@@ -1007,14 +364,116 @@ class Player:
             print(self.board)
             raise ValueError("Tried to remove king")
 
+    @property
+    def in_check(self):
+        """True while our king is attacked"""
+        return bool(self.checkers)
+
+    @property
+    def attacks(self):
+        """bitboard of every square attacked by our pieces
+        computed at most once per position: make_move clears it and unmake_move puts the previous map back
+        """
+        if self._attacks is None:
+            self._attacks = self.board.bitboard.attacks_by(self.color)
+        return self._attacks
+
+    @property
+    def occupancy(self):
+        """bitboard of the squares occupied by our pieces"""
+        return self.board.bitboard.colors[self.color]
+
+    def promotion_type(self):
+        """returns the piece type our pawns turn into on the last row (None if they stay pawns)"""
+        pieces = self.board.bitboard.pieces
+        if pieces[(self.color, "queen")] == 0:
+            return "queen"
+        for piece_type in ("rook", "bishop", "knight"):
+            if pop_count(pieces[(self.color, piece_type)]) < 2:
+                return piece_type
+        return None
+
+    def pin_analysis(self):
+        """returns the PinAnalysis of the current position, worked out once per position
+        (make_move clears it and unmake_move puts the previous one back)
+        """
+        if self._pin_analysis is None:
+            bitboard = self.board.bitboard
+            pieces = bitboard.pieces
+            opponent_color = self.opponent.color
+            own = bitboard.colors[self.color]
+            occupied = bitboard.occupied
+            king_square = self.king.square
+
+            checkers = 0
+            for piece in self.checkers:
+                checkers |= 1 << piece.square
+
+            king_targets = (own | pieces[(opponent_color, "king")]) ^ FULL_BOARD
+            if checkers & (checkers - 1):
+                # double check: only the king can move
+                targets = 0
+            elif checkers:
+                # capture the checker or step between it and our king
+                targets = king_targets & (checkers | BETWEEN[king_square][checkers.bit_length() - 1])
+            else:
+                targets = king_targets
+
+            # opponent rooks, bishops and queens on a free line to our king apart from exactly one of our pieces
+            pins = {}
+            opponent_pieces = bitboard.colors[opponent_color]
+            snipers = ((rook_attacks(king_square, opponent_pieces) &
+                        (pieces[(opponent_color, "rook")] | pieces[(opponent_color, "queen")])) |
+                       (bishop_attacks(king_square, opponent_pieces) &
+                        (pieces[(opponent_color, "bishop")] | pieces[(opponent_color, "queen")])))
+            for sniper in iter_squares(snipers):
+                blockers = BETWEEN[king_square][sniper] & occupied
+                if blockers & own and not blockers & (blockers - 1):
+                    pins[blockers.bit_length() - 1] = BETWEEN[king_square][sniper] | (1 << sniper)
+
+            self._pin_analysis = PinAnalysis(checkers, king_targets, targets, pins)
+        return self._pin_analysis
+
+    def generate_legal_moves(self, captures_only=False):
+        """returns every legal Move we can make in the current position
+        every piece reads the checks and pins from the same pin_analysis
+        args:
+        captures_only: bool, only captures and promotions (the moves of the quiescence search)
+        """
+        counters = self.board.search_counters
+        if counters is not None:
+            start = time.perf_counter()
+        analysis = self.pin_analysis()
+        squares = self.board.squares
+        promotion_type = None
+        moves = []
+        capture_mask = self.board.bitboard.colors[self.opponent.color]
+        pawn_mask = capture_mask
+        if captures_only and self.promotion_type() is not None:
+            # a step onto the last row is only a promotion if there is a piece type left to promote to
+            pawn_mask |= PROMOTION_ROWS
+        for piece in self.pieces:
+            from_square = piece.square
+            is_pawn = piece.piece_type == "pawn"
+            targets = piece.legal_targets(analysis)
+            if captures_only:
+                targets &= pawn_mask if is_pawn else capture_mask
+            for to_square in iter_squares(targets):
+                captured = squares[to_square]
+                promotion = None
+                if is_pawn and to_square // 8 in (0, 7):
+                    if promotion_type is None:
+                        promotion_type = self.promotion_type()
+                    promotion = promotion_type
+                moves.append(Move(from_square, to_square, piece.id, captured.id if captured else 0, promotion))
+        if counters is not None:
+            counters.movegen_seconds += time.perf_counter() - start
+        return moves
+
     def get_available_pieces(self):
         """returns a sublist of Player.pieces for which legal steps are available"""
-        available = []
-        for piece in self.pieces:
-            avail = piece.get_legal_positions()
-            if avail:
-                available.append(piece)
-        return available
+        from_squares = {move.from_square for move in self.generate_legal_moves()}
+        return [piece for piece in self.pieces if piece.square in from_squares]
 
     def get_piece(self, position=None, id=None, name=None):
         """returns a Piece instance based on either position or id"""
@@ -1039,86 +498,80 @@ class Player:
         get the score of the player at a particular point during the game
         this is used to rank steps for the chess bot
         """
-        our_total = sum([piece.value for piece in self.pieces])
-        opponent_total = sum([piece.value for piece in self.opponent.pieces])
-
-        if self.king.king_in_check():
-            our_total -= 100
-            if self.losing:
-                our_total -= 1000
-
-        if self.opponent.king.king_in_check():
-            our_total += 100
-            if self.opponent.losing:
-                our_total += 1000
-
-        our_score = (our_total - opponent_total) + random.randint(1, 3)
+        # material, piece-square and mobility balance in piece value units (a pawn is 1)
+        counters = self.board.search_counters
+        if counters is not None:
+            start = time.perf_counter()
+        our_score = evaluation.evaluate(self) / 100
+        if counters is not None:
+            counters.evaluation_seconds += time.perf_counter() - start
+
+        # checkmate and stalemate are not looked for here: look_forward checks the legal moves of the opponent first
+        if self.in_check:
+            our_score -= 100
+        if self.opponent.in_check:
+            our_score += 100
+
+        our_score = our_score + random.randint(1, 3)
         return our_score
 
     def look_forward(self, counter=0, max_depth=1):
         """ Chess bot only:
         Looks ahead max_depth steps and decides which step to take based on the outcome of board.calculate_score
         returns current_best = [score, piece, new_position]"""
+        moves = self.generate_legal_moves()
+        if self.board.search_counters is not None:
+            self.board.search_counters.nodes += len(moves)
 
         if counter == max_depth:
             current_best_score = -100000000
             current_best_move = None
 
-            available_pieces = self.get_available_pieces()
-            for piece in available_pieces:
-
-                avail_positions = piece.get_legal_positions()
-                avail_positions = self.king.remove_duplicate_positions(avail_positions)
-
-                for pos in avail_positions:
+            for move in moves:
+                piece = self.board.squares[move.from_square]
 
-                    piece.move(to=pos)
-
-                    if counter == max_depth:
-                        score = self.calculate_score() # HAVE TO IMPLEMENT THIS !!!!
-                        # print("score", score)
-                        self.board.pop_last_move()
+                self.board.make_move(move)
+                if self.opponent.has_legal_move():
+                    score = self.calculate_score()
+                elif self.opponent.in_check:
+                    # checkmate
+                    score = 1000
+                else:
+                    # stalemate
+                    score = 0
+                self.board.unmake_move()
 
-                        if score > current_best_score:
-                            current_best_score = score
-                            current_best_move = (piece, pos)
+                if score > current_best_score:
+                    current_best_score = score
+                    current_best_move = (piece, square_position(move.to_square))
 
             if max_depth == 0:
-                return current_best_move
+                return current_best_move if current_best_move is not None else (None, None)
             else:
                 return current_best_score
 
         else:
             opponents_max = 100000000
             current_best_move = None
-            available_pieces = self.get_available_pieces()
 
-            for piece in available_pieces:
-                avail_positions = piece.get_legal_positions()
-                avail_positions = self.king.remove_duplicate_positions(avail_positions)
+            for move in moves:
+                piece = self.board.squares[move.from_square]
 
-                for pos in avail_positions:
-                    piece.move(to=pos)
-                    opponents_best_score = self.opponent.look_forward(counter=(counter+1), max_depth=0)
-                    self.board.pop_last_move()
+                self.board.make_move(move)
+                opponents_best_score = self.opponent.look_forward(counter=(counter+1), max_depth=max_depth)
+                self.board.unmake_move()
 
-                    if opponents_best_score < opponents_max:
-                        opponents_max = opponents_best_score
-                        current_best_move = (piece, pos)
+                if opponents_best_score < opponents_max:
+                    opponents_max = opponents_best_score
+                    current_best_move = (piece, square_position(move.to_square))
 
             if counter == 0:
-                return current_best_move
+                return current_best_move if current_best_move is not None else (None, None)
             else:
                 return opponents_max
 
     def select_depth(self, verbose=True):
-        avail_pieces = self.get_available_pieces()
-        # opp_avail_pieces = self.opponent.get_available_pieces()
-        complexity = []
-        for p in avail_pieces:
-            complexity.extend(p.get_legal_positions())
-        # for opp_p in opp_avail_pieces:
-        #     complexity.extend(opp_p.get_legal_positions())
+        complexity = self.generate_legal_moves()
 
         if len(complexity) < 4:
             d = 2
@@ -1163,9 +616,9 @@ class Player:
         p = self.get_piece(name=piece_repr)
         new_pos = np.array([x, y])
 
-        legal = p.get_legal_positions()
+        legal = [move.to_square for move in self.generate_legal_moves() if p is not None and move.from_square == p.square]
         if legal:
-            if tuple(new_pos) in [tuple(item) for item in legal]:
+            if 1 <= x <= 8 and 1 <= y <= 8 and square_index(new_pos) in legal:
                 return p, new_pos
             else:
                 print("Invalid step!")
@@ -1177,68 +630,151 @@ class Player:
             return p, new_pos
 
 
-    def choose_move(self):
+    def choose_move(self, with_stats=False, verbose=True):
+        """returns (piece, new_pos) of our next move
+        with_stats: bool, if True the move is returned with the SearchStats of its search: piece, new_pos, stats
+        verbose: bool, if False nothing is printed (the adaptive depth, a possible tie)
+        """
+        counters = None
+        if with_stats:
+            counters = self.board.search_counters = SearchCounters()
+        # plies searched (for the stats)
+        depth = 0
+        book_move = None
+        if self.book is not None and self.engine not in ("human", 0):
+            book_move = self.book.choose(self.board)
+
         if self.engine == "human" or self.engine == 0:
             p, new_pos = self.human_move()
+        elif book_move is not None:
+            p, new_pos = self.board.squares[book_move.from_square], square_position(book_move.to_square)
         elif self.engine == "robot" or self.engine == 1:
-            if self.max_depth == "adaptive":
-                depth = self.select_depth()
+            if self.search == "alphabeta":
+                p, new_pos = self.searcher.choose_move(self.max_depth)
             else:
-                depth = self.max_depth
-            p, new_pos = self.look_forward(max_depth=depth)
+                if self.max_depth == "adaptive":
+                    depth = self.select_depth(verbose)
+                else:
+                    depth = self.max_depth
+                p, new_pos = self.look_forward(max_depth=depth)
+                # max_depth=0 looks 1 step ahead
+                depth += 1
         else:
             current_board = self.encode_board()
             p, new_pos = self.nn.forward_pass(current_board)
 
-        if not isinstance(p, Piece):
+        if verbose and not isinstance(p, Piece):
             print("Possible tie")
+        if with_stats:
+            self.board.search_counters = None
+            if self.engine in ("robot", 1) and self.search == "alphabeta" and book_move is None:
+                stats = self.searcher.stats(counters)
+            else:
+                stats = counters.stats(counters.nodes, depth)
+            return p, new_pos, stats
         return p, new_pos
 
     def piece_giving_check(self):
         """returns our player's pieces which are giving check to opponent's king"""
-        for p in self.pieces:
-            if p.giving_check():
-                return p
+        if self.opponent.checkers:
+            return self.opponent.checkers[0]
 
     @property
     def losing(self):
         """returns True if we are suffering check mate, ends the game"""
-        if self.king.king_in_check():
-            check_giving_piece = self.opponent.piece_giving_check()
+        return self.board.game_status(self) == CHECKMATE
 
-            if not isinstance(check_giving_piece, Piece):
-                return False
+    def has_legal_move(self):
+        """returns True as soon as one legal move is found (cheaper than generate_legal_moves)
+        the king is tried first: out of check it almost always has a step
+        """
+        analysis = self.pin_analysis()
+        if self.king.legal_targets(analysis):
+            return True
+        for piece in self.pieces:
+            if piece is not self.king and piece.legal_targets(analysis):
+                return True
+        return False
+
+
+class GameObserver:
+    """Receives the events of Board.play(observers=[...]): subclass it and override the events to handle,
+    or pass the functions handling them
+
+    args:
+    on_move, on_capture, on_promotion, on_game_end: functions taking the arguments of the methods of the same name
+    """
+    def __init__(self, on_move=None, on_capture=None, on_promotion=None, on_game_end=None):
+        for name, callback in (("on_move", on_move), ("on_capture", on_capture), ("on_promotion", on_promotion),
+                               ("on_game_end", on_game_end)):
+            if callback is not None:
+                setattr(self, name, callback)
+
+    def on_move(self, board, player, move, ply):
+        """player made move (a Move, already on the board), the ply-th of the game"""
+        pass
 
-            for p in self.pieces:
-                if not p.capture_ability(check_giving_piece):
-                    avail = self.king.get_legal_positions()
-                    if avail:
-                        return False
-                    else:
-                        if check_giving_piece.piece_type != "knight":
-                            step_between_them = []
-                            check_threat = check_giving_piece.positions_kept_in_check()
-                            direction_signs = np.sign(self.king.position - check_giving_piece.position)
-
-                            for pos in check_threat:
-                                if np.all(np.sign(pos - check_giving_piece.position) == direction_signs):
-                                    step_between_them.append(pos)
-
-                            avail_pieces = self.get_available_pieces()
-
-                            for piece in avail_pieces:
-                                avail_positions = piece.get_legal_positions()
-                                for pos in step_between_them:
-                                    if tuple(pos) in [tuple(item) for item in avail_positions]:
-                                        return False
-                else:
-                    return False
+    def on_capture(self, board, player, move, captured):
+        """move of player took the opponent piece captured (called after on_move)"""
+        pass
 
-            # After the for loop
-            # None of the pieces returned False -- so it must be True
-            return True
-        else:
-            return False
+    def on_promotion(self, board, player, move, promoted):
+        """move of player turned a pawn into the piece promoted (called after on_move)"""
+        pass
+
+    def on_game_end(self, board, winner, loser, tie, reason, ply):
+        """the game ended after ply plies: winner, loser, tie as returned by play, reason is board.termination"""
+        pass
+
+
+class ConsoleObserver(GameObserver):
+    """Prints a game of Board.play to the console (what play does unless headless)
+
+    args:
+    show: bool, if True prints the board after every single step (and waits delay seconds)
+    verbose: bool, if True prints every moved piece and its new position
+    """
+    def __init__(self, show=True, verbose=True, delay=3):
+        super().__init__()
+        self.show = show
+        self.verbose = verbose
+        self.delay = delay
+
+    def on_move(self, board, player, move, ply):
+        if self.verbose:
+            print(". \n" * 8, end="")
+            undo = board.move_history[-1]
+            print(f"{player.engine.upper()}'s move: {undo.piece} to {tuple(undo.new_position)}")
+            if undo.captured is not None:
+                print(undo.captured)
+        if self.show:
+            print(board)
+            time.sleep(self.delay)
+        if ply in (50, 100, 150):
+            print(ply)
+
+    def on_game_end(self, board, winner, loser, tie, reason, ply):
+        if reason == "no move":
+            print("Finished with a tie!")
+            return
+        if reason in ("threefold repetition", "fifty-move rule"):
+            print(f"Draw by {reason} -- stopping game")
+        elif reason == "resignation":
+            print(f"{loser.color} resigns -- stopping game")
+        elif reason == "adjudicated draw":
+            print("Adjudicated draw -- stopping game")
+        elif reason == "tablebase":
+            print("Tablebase result -- stopping game")
+        elif reason == "king vs king":
+            print("King vs King -- stopping game")
+        elif reason == "max_steps":
+            print(f"Reached max_steps={board.max_steps} -- stopping game")
+        print(board)
+        if winner is not None:
+            print(f"{loser.color} has lost")
+            print("Total number of steps: ", ply)
+        elif reason == STALEMATE:
+            print(f"{board.side_to_move.color} is stalemated")
 
 
 class Board:
@@ -1249,6 +785,25 @@ class Board:
         self.players = [player_1, player_2]
         self.max_steps = max_steps
         self.move_history = []
+        # the player whose turn it is, switched by make_move / unmake_move
+        self.side_to_move = player_1
+        # 64-bit Zobrist key of the position (pieces and side to move), updated by make_move / unmake_move
+        self.zobrist_key = 0
+        # game status by (zobrist_key, color), see game_status
+        self.status_cache = {}
+        # plies since the last capture or pawn step (fifty-move rule), updated by make_move / unmake_move
+        self.halfmove_clock = 0
+        # how the last game of play ended: "checkmate", "stalemate", "threefold repetition", "fifty-move rule",
+        # "resignation", "adjudicated draw", "king vs king", "max_steps" or "no move"
+        self.termination = None
+        # number of games of play on this board ended early by a draw rule (threefold repetition, fifty-move rule),
+        # by the tablebase or by adjudication (resignation, adjudicated draw), by reason
+        self.early_terminations = collections.Counter()
+        # search.SearchCounters of the move being chosen with stats (None otherwise), see Player.choose_move
+        self.search_counters = None
+        # with play(stats=True): SearchStats of every move and of the whole game by color
+        self.move_stats = {}
+        self.search_stats = {}
         if reset:
             self.reset()
         # set board
@@ -1259,6 +814,9 @@ class Board:
         self.set_players_for_pieces()
         # initialize all cells with None
         self.cells = {pos: None for pos in self.all_positions}
+        # bitboard position core and the piece standing on each square (0-63), both kept in sync with self.cells
+        self.bitboard = BitBoard()
+        self.squares = [None] * 64
         # set each cell's content to the corresponding piece if it is occupied by one, else leave it None
         self.update_board()
 
@@ -1307,6 +865,23 @@ class Board:
             player.knights = [Knight(name=knight_name, color=player.color) for knight_name in KNIGHT_NAMES]
             player.pieces = player.pawns + player.bishops + player.knights + player.rooks + [player.king] + [player.queen]
 
+    def set_position(self, positions, side_to_move="white"):
+        """Sets up a custom position: only the pieces listed in positions are kept, on the given cells
+        args:
+        positions: dict {(name, color): (x, y)} like STARTING_POSITIONS, e.g. {("king", "white"): (5, 1), ...}
+            both kings have to be listed
+        side_to_move: str, color of the player to move
+        """
+        for player in self.players:
+            player.pieces = [piece for piece in player.pieces if (piece.name, piece.color) in positions]
+            for piece in player.pieces:
+                piece.position = np.array(positions[(piece.name, piece.color)])
+        self.move_history = []
+        self.status_cache = {}
+        self.halfmove_clock = 0
+        self.side_to_move = self.get_player(side_to_move)
+        self.update_board()
+
     def update_elo_score(self, winner, loser, tie, capture_bias=False):
         k_factor = 32
         base = 10
@@ -1341,9 +916,197 @@ class Board:
     def pop_last_move(self):
         """ Chess bot only:
         deletes the last move from self.move_history"""
-        piece, old_pos, new_pos = self.move_history[-1]
-        piece.position = old_pos
-        self.move_history.pop(-1)
+        self.unmake_move()
+
+    def is_legal(self, piece, new_pos):
+        """returns True if piece can legally step to new_pos in the current position"""
+        from_square = piece.square
+        to_square = square_index(new_pos)
+        return any(move.from_square == from_square and move.to_square == to_square
+                   for move in piece.player.generate_legal_moves())
+
+    def create_move(self, piece, new_pos):
+        """returns the Move of piece stepping to new_pos in the current position"""
+        to_square = square_index(new_pos)
+        captured = self.squares[to_square]
+        if captured is not None and captured.color == piece.color:
+            raise ValueError(f"{piece} cannot step to {SQUARE_CELLS[to_square]}: {captured} of its color stands there")
+        capture = captured.id if captured is not None else 0
+        promotion = piece.promotion_type(to_square) if piece.piece_type == "pawn" else None
+        return Move(piece.square, to_square, piece.id, capture, promotion)
+
+    def make_move(self, move, remember=True):
+        """plays a Move: updates the cells, bitboards, piece lists, captured piece, promotion and check state
+        args:
+        move: Move, e.g. from create_move
+        remember: bool, if True the move is appended to self.move_history and can be undone with unmake_move
+        """
+        from_square, to_square = move.from_square, move.to_square
+        piece = self.squares[from_square]
+        player = piece.player
+        opponent = piece.opponent
+        old_position = piece.position
+        new_position = square_position(to_square)
+
+        key = self.zobrist_key
+        evaluation_state = (player.material, player.positional_mg, player.positional_eg,
+                            opponent.material, opponent.positional_mg, opponent.positional_eg)
+
+        # remove the captured piece
+        captured = self.squares[to_square] if move.capture else None
+        captured_index = None
+        if captured is not None:
+            captured_index = opponent.pieces.index(captured)
+            opponent.pieces.pop(captured_index)
+            self.bitboard.remove(captured.color, captured.piece_type, to_square)
+            self.zobrist_key ^= captured.zobrist_keys[to_square]
+            opponent.material -= captured.value
+            opponent.positional_mg -= captured.square_values_mg[to_square]
+            opponent.positional_eg -= captured.square_values_eg[to_square]
+
+        # step
+        self.bitboard.move(piece.color, piece.piece_type, from_square, to_square)
+        piece.position = new_position
+        self.squares[from_square] = None
+        self.squares[to_square] = piece
+        self.cells[SQUARE_CELLS[from_square]] = None
+        self.cells[SQUARE_CELLS[to_square]] = piece
+        self.zobrist_key ^= piece.zobrist_keys[from_square] ^ piece.zobrist_keys[to_square] ^ zobrist.SIDE_KEY
+        player.positional_mg += piece.square_values_mg[to_square] - piece.square_values_mg[from_square]
+        player.positional_eg += piece.square_values_eg[to_square] - piece.square_values_eg[from_square]
+
+        # replace the pawn with its promoted piece
+        promoted = None
+        pawn_index = None
+        if move.promotion is not None:
+            promoted = PROMOTION_CLASSES[move.promotion](name=f"{move.promotion}_new", color=piece.color)
+            promoted.position = new_position
+            promoted.board = self
+            promoted.player = player
+            promoted.opponent = opponent
+            pawn_index = player.pieces.index(piece)
+            player.pieces.pop(pawn_index)
+            player.pieces.append(promoted)
+            self.bitboard.remove(piece.color, piece.piece_type, to_square)
+            self.bitboard.add(promoted.color, promoted.piece_type, to_square)
+            self.squares[to_square] = promoted
+            self.cells[SQUARE_CELLS[to_square]] = promoted
+            self.zobrist_key ^= piece.zobrist_keys[to_square] ^ promoted.zobrist_keys[to_square]
+            player.material += promoted.value - piece.value
+            player.positional_mg += promoted.square_values_mg[to_square] - piece.square_values_mg[to_square]
+            player.positional_eg += promoted.square_values_eg[to_square] - piece.square_values_eg[to_square]
+
+        if remember:
+            self.move_history.append(UndoState(piece, old_position, new_position, move, captured, captured_index,
+                                               promoted, pawn_index, self.attack_state(), key, evaluation_state,
+                                               self.halfmove_clock))
+        if captured is not None or piece.piece_type == "pawn":
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        self.side_to_move = opponent
+        self.update_check_state()
+
+    def make_null_move(self):
+        """passes the turn to the opponent without moving (null-move pruning of the search), undone by unmake_move
+        only allowed when the player to move is not in check
+        """
+        self.move_history.append(UndoState(None, None, None, None, None, None, None, None, None, self.zobrist_key,
+                                           None, self.halfmove_clock))
+        self.zobrist_key ^= zobrist.SIDE_KEY
+        self.side_to_move = self.side_to_move.opponent
+
+    def unmake_move(self):
+        """takes back the last move of self.move_history, restoring the position before make_move"""
+        undo = self.move_history.pop()
+        if undo.move is None:
+            # null move: the position did not change
+            self.zobrist_key = undo.key
+            self.side_to_move = self.side_to_move.opponent
+            return
+        piece = undo.piece
+        from_square, to_square = undo.move.from_square, undo.move.to_square
+
+        # turn the promoted piece back into the pawn
+        if undo.promoted is not None:
+            piece.player.pieces.pop()
+            piece.player.pieces.insert(undo.pawn_index, piece)
+            self.bitboard.remove(undo.promoted.color, undo.promoted.piece_type, to_square)
+            self.bitboard.add(piece.color, piece.piece_type, to_square)
+
+        # step back
+        self.bitboard.move(piece.color, piece.piece_type, to_square, from_square)
+        piece.position = undo.old_position
+        self.squares[from_square] = piece
+        self.cells[SQUARE_CELLS[from_square]] = piece
+        self.squares[to_square] = undo.captured
+        self.cells[SQUARE_CELLS[to_square]] = undo.captured
+
+        # put back the captured piece
+        if undo.captured is not None:
+            captured = undo.captured
+            piece.opponent.pieces.insert(undo.captured_index, captured)
+            self.bitboard.add(captured.color, captured.piece_type, to_square)
+
+        for player, state in zip(self.players, undo.attack_state):
+            player._attacks, player.checkers, player._pin_analysis = state
+        self.zobrist_key = undo.key
+        self.halfmove_clock = undo.halfmove_clock
+        player, opponent = piece.player, piece.opponent
+        (player.material, player.positional_mg, player.positional_eg,
+         opponent.material, opponent.positional_mg, opponent.positional_eg) = undo.evaluation_state
+        self.side_to_move = player
+
+    def game_status(self, player=None):
+        """returns the status of player in the current position: ONGOING, CHECK, CHECKMATE or STALEMATE
+        decided by one early-exit legal move probe (Player.has_legal_move) and remembered by position key
+        args:
+        player: Player, defaults to the player to move
+        """
+        if player is None:
+            player = self.side_to_move
+        cache_key = (self.zobrist_key, player.color)
+        status = self.status_cache.get(cache_key)
+        if status is None:
+            if player.has_legal_move():
+                status = CHECK if player.in_check else ONGOING
+            else:
+                status = CHECKMATE if player.in_check else STALEMATE
+            if len(self.status_cache) >= STATUS_CACHE_SIZE:
+                self.status_cache.clear()
+            self.status_cache[cache_key] = status
+        return status
+
+    def repetition_count(self):
+        """returns how many times the current position has occurred in the game (1 if it is new)
+        only the positions since the last capture or pawn step are compared: none before them can come back
+        """
+        key = self.zobrist_key
+        count = 1
+        for undo in self.move_history[len(self.move_history) - self.halfmove_clock:]:
+            if undo.key == key:
+                count += 1
+        return count
+
+    def draw_reason(self):
+        """returns "threefold repetition" or "fifty-move rule" if the game is drawn by one of them, else None"""
+        if self.halfmove_clock >= 4 and self.repetition_count() >= REPETITIONS:
+            return "threefold repetition"
+        if self.halfmove_clock >= FIFTY_MOVE_PLIES:
+            return "fifty-move rule"
+        return None
+
+    def attack_state(self):
+        """returns the attack maps, checkers and pin analyses of both players (saved by make_move for unmake_move)"""
+        return tuple((player._attacks, player.checkers, player._pin_analysis) for player in self.players)
+
+    def update_check_state(self):
+        """sets Player.checkers for both players from the bitboards and drops their outdated attack maps and pins"""
+        for player in self.players:
+            attackers = self.bitboard.attackers_to(player.king.square, player.opponent.color)
+            player.checkers = [self.squares[square] for square in iter_squares(attackers)] if attackers else []
+            player._attacks = None
+            player._pin_analysis = None
 
     def set_opponents_for_players_and_pieces(self):
         self.player_1.opponent = self.player_2
@@ -1376,26 +1139,55 @@ class Board:
             raise ValueError(f"no player with color: {color}")
 
     def update_board(self):
-        """Update every cell to contain a piece object based on the piece's position"""
+        """Update every cell (and the bitboards) to contain a piece object based on the piece's position"""
         self.cells = {pos: None for pos in self.all_positions}
+        self.squares = [None] * 64
+        self.bitboard.clear()
         for player in self.players:
             for piece in player.pieces:
                 self.cells[tuple(piece.position)] = piece
+                self.squares[piece.square] = piece
+                self.bitboard.add(piece.color, piece.piece_type, piece.square)
+        self.zobrist_key = zobrist.position_key(self.player_1.pieces + self.player_2.pieces, self.side_to_move.color)
+        for player in self.players:
+            player.material = evaluation.material(player.pieces)
+            player.positional_mg, player.positional_eg = evaluation.positional(player.pieces)
+        self.update_check_state()
 
-    def play(self, show=True, verbose=True):
+    def play(self, show=True, verbose=True, adjudication=None, tablebase=None, stats=False, observers=None,
+             headless=False):
         """Plays one chess game
+        returns winner, loser, tie (None, None, True for a draw), the reason the game ended is kept in self.termination
 
         args:
         show: bool, if True prints the board after every single step
         verbose: bool, if True prints every moved piece and its new position
+        adjudication: Adjudication, ends decided games early by resignation or draw (None: play them out)
+        tablebase: tablebase.Tablebase, ends the game as soon as few enough pieces are left to look its result up
+        stats: bool, if True the SearchStats of every move are kept in self.move_stats and added up for the game in
+            self.search_stats (both by color)
+        observers: list of GameObserver, told about every move, capture, promotion and the end of the game
+        headless: bool, if True nothing is printed (show and verbose are ignored), the game is only reported to
+            observers: the loop of self-play games without any I/O
 
         The 'black' chess bot adaptively selects the max_depth to which it looks ahead
                 based on the number of legal steps it can take (e.g. advantageous when its king is in check)
         The 'white' chess bot consistently looks 1 step ahead (which is defined as max_depth=0)
         """
+        observers = list(observers or [])
+        if not headless:
+            # printing the game is one more observer
+            observers.insert(0, ConsoleObserver(show, verbose))
         winner = None
         loser = None
         tie = False
+        self.termination = None
+        self.move_stats = {player.color: [] for player in self.players}
+        self.search_stats = {}
+        # consecutive plies meeting the resignation (by the same leader) and the draw conditions of adjudication
+        resign_streak = 0
+        leader = None
+        draw_streak = 0
 
         i = 0
         run = True
@@ -1407,72 +1199,111 @@ class Board:
                 active_player = self.player_2
                 passive_player = self.player_1
 
-            active_piece, new_pos = active_player.choose_move()
-
-            if verbose:
-                print(". ")
-                print(". ")
-                print(". ")
-                print(". ")
-                print(". ")
-                print(". ")
-                print(". ")
-                print(". ")
-                print(f"{active_player.engine.upper()}'s move: {active_piece} to {tuple(new_pos)}")
-
-            if active_piece:
-                # if opponent is there -- remove that piece from the board
-                capture = passive_player.get_piece(new_pos)
-                if capture is not None:
-                    passive_player.pop_piece(capture, verbose)
-                active_piece.move(to=new_pos)
-                active_piece.promote(new_pos, verbose)
-
+            if stats:
+                active_piece, new_pos, move_stats = active_player.choose_move(with_stats=True, verbose=not headless)
+                self.move_stats[active_player.color].append(move_stats)
             else:
-                if run:
-                    print("Finished with a tie!")
-                    tie = True
-                    return winner, loser, tie
-
-            self.update_board()
+                active_piece, new_pos = active_player.choose_move(verbose=not headless)
 
-            if show:
-                # show board
-                print(self)
-                time.sleep(3)
+            # an illegal choice (e.g. the ai's second best step when only one step is legal) ends the game like no move
+            if not active_piece or not self.is_legal(active_piece, new_pos):
+                self.termination = "no move"
+                tie = True
+                break
 
-            # increment i
+            # if opponent is there make_move removes that piece from the board, a pawn may also be promoted
+            move = self.create_move(active_piece, new_pos)
+            self.make_move(move)
             i += 1
-            if (i == 50) or (i == 100) or (i == 150):
-                print(i)
-
-            # Check if anyone is losing
-            run = not np.any([self.player_1.losing, self.player_2.losing])
+            if observers:
+                undo = self.move_history[-1]
+                for observer in observers:
+                    observer.on_move(self, active_player, move, i)
+                    if undo.captured is not None:
+                        observer.on_capture(self, active_player, move, undo.captured)
+                    if undo.promoted is not None:
+                        observer.on_promotion(self, active_player, move, undo.promoted)
+
+            # Check if the opponent is mated or stalemated
+            status = self.game_status(passive_player)
+            run = status in (ONGOING, CHECK)
+            if not run:
+                self.termination = status
+
+            # Look the result up once few pieces are left
+            if run and tablebase is not None:
+                value = tablebase.probe(self)
+                if value is not None:
+                    if value > 0:
+                        winner, loser = passive_player, active_player
+                    elif value < 0:
+                        winner, loser = active_player, passive_player
+                    self.early_terminations["tablebase"] += 1
+                    self.termination = "tablebase"
+                    run = False
+
+            # Check for a draw by threefold repetition or the fifty-move rule
+            if run:
+                reason = self.draw_reason()
+                if reason is not None:
+                    self.early_terminations[reason] += 1
+                    self.termination = reason
+                    run = False
+
+            # Adjudicate decided games
+            if run and adjudication is not None:
+                score = evaluation.evaluate(self.player_1) / 100
+                if abs(score) >= adjudication.resign_threshold:
+                    ahead = self.player_1 if score > 0 else self.player_2
+                    resign_streak = resign_streak + 1 if ahead is leader else 1
+                    leader = ahead
+                else:
+                    resign_streak = 0
+                    leader = None
+                n_pieces = len(self.player_1.pieces) + len(self.player_2.pieces)
+                if (i >= adjudication.draw_after_ply and n_pieces <= adjudication.draw_max_pieces
+                        and abs(score) <= adjudication.draw_threshold):
+                    draw_streak += 1
+                else:
+                    draw_streak = 0
+
+                if resign_streak >= adjudication.resign_plies:
+                    winner = leader
+                    loser = leader.opponent
+                    self.termination = "resignation"
+                    run = False
+                elif draw_streak >= adjudication.draw_plies:
+                    self.termination = "adjudicated draw"
+                    run = False
+                if not run:
+                    self.early_terminations[self.termination] += 1
 
             # Check if we only have king vs king
-            if (len(self.player_1.pieces) + len(self.player_2.pieces)) == 2:
-                print("King vs King -- stopping game")
+            if run and (len(self.player_1.pieces) + len(self.player_2.pieces)) == 2:
+                self.termination = "king vs king"
                 run = False
 
             # Check if we reached 1000 steps
-            if i > self.max_steps:
-                print(f"Reached max_steps={self.max_steps} -- stopping game")
+            if run and i > self.max_steps:
+                self.termination = "max_steps"
                 run = False
 
-            if not run:
-                print(self)
-                if self.player_1.losing:
-                    print(f"{self.player_1.color} has lost")
-                    winner = self.player_2
-                    loser = self.player_1
-                elif self.player_2.losing:
-                    print(f"{self.player_2.color} has lost")
-                    winner = self.player_1
-                    loser = self.player_2
+            if not run and winner is None:
+                # a resignation or a tablebase win has its winner already
+                if status == CHECKMATE:
+                    winner = active_player
+                    loser = passive_player
                 else:
                     tie = True
-                    return winner, loser, tie
-                print("Total number of steps: ", i)
+
+        result = self.result(winner, loser, tie)
+        for observer in observers:
+            observer.on_game_end(self, winner, loser, tie, self.termination, i)
+        return result
+
+    def result(self, winner, loser, tie):
+        """returns the outcome of play: winner, loser, tie (the reason the game ended is kept in self.termination)"""
+        self.search_stats = {color: aggregate_stats(moves) for color, moves in self.move_stats.items() if moves}
         return winner, loser, tie
 
 def main():
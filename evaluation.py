@@ -0,0 +1,236 @@
+import numpy as np
+from bitboard import pop_count, COLORS
+
+# Static evaluation of a position in centi-pawns, from the point of view of one player
+# The material and piece-square terms are running totals kept on each Player by Board.make_move / Board.unmake_move,
+# the mobility term is read from the players' attack maps, so a leaf costs a constant instead of a move generation
+# The piece-square terms are tapered: a middlegame and an endgame table are mixed by the game phase, which goes from
+# MAX_PHASE (every knight, bishop, rook and queen on the board) down to 0 (only kings and pawns left)
+
+# Piece-square tables in centi-pawns from white's side, written as seen from white: the first row is y=8, the last y=1
+MIDDLEGAME_TABLES = {
+    "pawn": (
+        0, 0, 0, 0, 0, 0, 0, 0,
+        50, 50, 50, 50, 50, 50, 50, 50,
+        10, 10, 20, 30, 30, 20, 10, 10,
+        5, 5, 10, 25, 25, 10, 5, 5,
+        0, 0, 0, 20, 20, 0, 0, 0,
+        5, -5, -10, 0, 0, -10, -5, 5,
+        5, 10, 10, -20, -20, 10, 10, 5,
+        0, 0, 0, 0, 0, 0, 0, 0),
+    "knight": (
+        -50, -40, -30, -30, -30, -30, -40, -50,
+        -40, -20, 0, 0, 0, 0, -20, -40,
+        -30, 0, 10, 15, 15, 10, 0, -30,
+        -30, 5, 15, 20, 20, 15, 5, -30,
+        -30, 0, 15, 20, 20, 15, 0, -30,
+        -30, 5, 10, 15, 15, 10, 5, -30,
+        -40, -20, 0, 5, 5, 0, -20, -40,
+        -50, -40, -30, -30, -30, -30, -40, -50),
+    "bishop": (
+        -20, -10, -10, -10, -10, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 10, 10, 5, 0, -10,
+        -10, 5, 5, 10, 10, 5, 5, -10,
+        -10, 0, 10, 10, 10, 10, 0, -10,
+        -10, 10, 10, 10, 10, 10, 10, -10,
+        -10, 5, 0, 0, 0, 0, 5, -10,
+        -20, -10, -10, -10, -10, -10, -10, -20),
+    "rook": (
+        0, 0, 0, 0, 0, 0, 0, 0,
+        5, 10, 10, 10, 10, 10, 10, 5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        0, 0, 0, 5, 5, 0, 0, 0),
+    "queen": (
+        -20, -10, -10, -5, -5, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 5, 5, 5, 0, -10,
+        -5, 0, 5, 5, 5, 5, 0, -5,
+        0, 0, 5, 5, 5, 5, 0, -5,
+        -10, 5, 5, 5, 5, 5, 0, -10,
+        -10, 0, 5, 0, 0, 0, 0, -10,
+        -20, -10, -10, -5, -5, -10, -10, -20),
+    "king": (
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -20, -30, -30, -40, -40, -30, -30, -20,
+        -10, -20, -20, -20, -20, -20, -20, -10,
+        20, 20, 0, 0, 0, 0, 20, 20,
+        20, 30, 10, 0, 0, 10, 30, 20),
+}
+
+# in the endgame pawns are worth more the further they got and the king belongs in the center
+ENDGAME_TABLES = dict(MIDDLEGAME_TABLES)
+ENDGAME_TABLES["pawn"] = (
+    0, 0, 0, 0, 0, 0, 0, 0,
+    80, 80, 80, 80, 80, 80, 80, 80,
+    50, 50, 50, 50, 50, 50, 50, 50,
+    30, 30, 30, 30, 30, 30, 30, 30,
+    20, 20, 20, 20, 20, 20, 20, 20,
+    10, 10, 10, 10, 10, 10, 10, 10,
+    10, 10, 10, 10, 10, 10, 10, 10,
+    0, 0, 0, 0, 0, 0, 0, 0)
+ENDGAME_TABLES["king"] = (
+    -50, -40, -30, -20, -20, -30, -40, -50,
+    -30, -20, -10, 0, 0, -10, -20, -30,
+    -30, -10, 20, 30, 30, 20, -10, -30,
+    -30, -10, 30, 40, 40, 30, -10, -30,
+    -30, -10, 30, 40, 40, 30, -10, -30,
+    -30, -10, 20, 30, 30, 20, -10, -30,
+    -30, -30, 0, 0, 0, 0, -30, -30,
+    -50, -30, -30, -30, -30, -30, -30, -50)
+
+# contribution of each piece on the board to the game phase
+PHASE_WEIGHTS = {"pawn": 0, "knight": 1, "bishop": 1, "rook": 2, "queen": 4, "king": 0}
+MAX_PHASE = 24
+
+# centi-pawns per square attacked outside our own pieces
+MOBILITY_WEIGHT = 2
+
+
+def piece_square_table(piece_type, color, endgame=False):
+    """returns the piece-square values of a piece by square (0-63), mirrored for black"""
+    table = ENDGAME_TABLES[piece_type] if endgame else MIDDLEGAME_TABLES[piece_type]
+    if color == "white":
+        return tuple(table[(7 - square // 8) * 8 + square % 8] for square in range(64))
+    return tuple(table[square] for square in range(64))
+
+
+def material(pieces):
+    """returns the summed Piece.value of pieces (piece value units, a pawn is 1)"""
+    return sum(piece.value for piece in pieces)
+
+
+def positional(pieces):
+    """returns the summed middlegame and endgame piece-square values of pieces in centi-pawns"""
+    return (sum(piece.square_values_mg[piece.square] for piece in pieces),
+            sum(piece.square_values_eg[piece.square] for piece in pieces))
+
+
+def game_phase(bitboard):
+    """returns the phase of the position from its bitboards: MAX_PHASE in the opening, 0 with kings and pawns only"""
+    pieces = bitboard.pieces
+    phase = 0
+    for color in COLORS:
+        phase += (pop_count(pieces[(color, "knight")] | pieces[(color, "bishop")]) +
+                  2 * pop_count(pieces[(color, "rook")]) + 4 * pop_count(pieces[(color, "queen")]))
+    return min(phase, MAX_PHASE)
+
+
+def taper(middlegame, endgame, phase):
+    """mixes a middlegame and an endgame score by the game phase"""
+    return (middlegame * phase + endgame * (MAX_PHASE - phase)) // MAX_PHASE
+
+
+def mobility(player):
+    """returns the number of squares attacked by player outside its own pieces"""
+    return pop_count(player.attacks & ~player.occupancy)
+
+
+def evaluate(player):
+    """returns the score of the position for player (ours - opponent's) in centi-pawns
+    material and piece-square terms come from Player.material and Player.positional_mg / positional_eg
+    (kept by Board.make_move)
+    """
+    opponent = player.opponent
+    score = round(100 * (player.material - opponent.material))
+    # tapered from white's side and then negated for black, like PieceSquareEvaluator.evaluate_batch: the floor
+    # division of taper would round a black score the other way
+    white, black = (player, opponent) if player.color == "white" else (opponent, player)
+    positional = taper(white.positional_mg - black.positional_mg, white.positional_eg - black.positional_eg,
+                       game_phase(player.board.bitboard))
+    score += positional if player is white else -positional
+    return score + MOBILITY_WEIGHT * (mobility(player) - mobility(opponent))
+
+
+# Player.encode_board lists the cells in Board.all_positions order (x-major): column i is x = i // 8 + 1, y = i % 8 + 1
+ENCODED_SQUARES = np.array([(i % 8) * 8 + i // 8 for i in range(64)])
+
+
+class PieceSquareEvaluator:
+    """Scores many encoded boards (Player.encode_board outputs) at once with numpy
+
+    The tables are indexed by piece id and encode_board column: TABLE[id, column] is the material plus piece-square
+    value of that piece on that cell, positive for white and negative for black (0 for id 0, the empty cell)
+    The score is the same as the material and piece-square part of evaluate (no mobility: it needs the bitboards)
+
+    args:
+    piece_ids: list of (id, repr) as in piece_ids.pickle, e.g. (1, "w_p1")
+    piece_values: dict {(name, color): value} as in piece_values.pickle
+    """
+    def __init__(self, piece_ids, piece_values):
+        pieces = {f"{color[0]}_{name[0]}{name[-1]}": (name.split(sep="_")[0], color, value)
+                  for (name, color), value in piece_values.items()}
+        size = max(piece_id for piece_id, _ in piece_ids) + 1
+        self.middlegame = np.zeros((size, 64), dtype=np.int32)
+        self.endgame = np.zeros((size, 64), dtype=np.int32)
+        self.phase = np.zeros(size, dtype=np.int32)
+        for piece_id, name in piece_ids:
+            if name is None or str(name) not in pieces:
+                continue
+            piece_type, color, value = pieces[str(name)]
+            sign = 1 if color == "white" else -1
+            middlegame = np.array(piece_square_table(piece_type, color))
+            endgame = np.array(piece_square_table(piece_type, color, endgame=True))
+            self.middlegame[piece_id] = sign * (round(100 * value) + middlegame[ENCODED_SQUARES])
+            self.endgame[piece_id] = sign * (round(100 * value) + endgame[ENCODED_SQUARES])
+            self.phase[piece_id] = PHASE_WEIGHTS[piece_type]
+
+    def evaluate_batch(self, encoded_boards, color="white", chunk_size=65536):
+        """returns the scores (np.array of N ints, centi-pawns) of N encoded boards for color
+        args:
+        encoded_boards: array-like of shape (N, 64) with piece ids, rows of Player.encode_board
+        chunk_size: number of boards scored in one vectorised step (bounds the temporary memory)
+        """
+        encoded_boards = np.asarray(encoded_boards, dtype=np.intp).reshape(-1, 64)
+        scores = np.empty(len(encoded_boards), dtype=np.int64)
+        columns = np.arange(64)
+        for start in range(0, len(encoded_boards), chunk_size):
+            ids = encoded_boards[start:start + chunk_size]
+            middlegame = self.middlegame[ids, columns].sum(axis=1, dtype=np.int64)
+            endgame = self.endgame[ids, columns].sum(axis=1, dtype=np.int64)
+            phase = np.minimum(self.phase[ids].sum(axis=1), MAX_PHASE)
+            scores[start:start + chunk_size] = (middlegame * phase + endgame * (MAX_PHASE - phase)) // MAX_PHASE
+        return scores if color == "white" else -scores
+
+    def evaluate_encoded(self, encoded_board, color="white"):
+        """returns the score (int, centi-pawns) of one encoded board for color"""
+        return int(self.evaluate_batch([encoded_board], color)[0])
+
+
+def check_batch(games=10, plies=200, seed=0):
+    """plays random games and returns the number of positions where PieceSquareEvaluator.evaluate_batch disagrees
+    with evaluate (without its mobility term) for either color
+    """
+    import random
+    from chess import Player, Board, PIECE_SQUARE_EVALUATOR
+    rng = random.Random(seed)
+    rows, expected = [], {color: [] for color in COLORS}
+    for _ in range(games):
+        players = {"white": Player("white", "robot", max_depth=0), "black": Player("black", "robot", max_depth=0)}
+        board = Board(players["white"], players["black"])
+        for _ in range(plies):
+            moves = board.side_to_move.generate_legal_moves()
+            if not moves:
+                break
+            board.make_move(rng.choice(moves))
+            rows.append(players["white"].encode_board())
+            for color, player in players.items():
+                expected[color].append(evaluate(player)
+                                       - MOBILITY_WEIGHT * (mobility(player) - mobility(player.opponent)))
+    return sum(int(np.count_nonzero(PIECE_SQUARE_EVALUATOR.evaluate_batch(rows, color) != expected[color]))
+               for color in COLORS)
+
+
+if __name__ == '__main__':
+    # python evaluation.py: checks that the batch and the incremental scores agree for both colors
+    mismatches = check_batch()
+    print(f"{mismatches} mismatching scores")
+    if mismatches:
+        raise SystemExit(1)
@@ -0,0 +1,90 @@
+from transposition import encode_move
+
+# Sort keys of the move classes, searched from the highest: hash move, captures and promotions, killers, the rest
+HASH_MOVE_SCORE = 10 ** 9
+CAPTURE_SCORE = 10 ** 7
+KILLER_SCORES = (2 * 10 ** 6, 10 ** 6)
+# history scores are halved once they reach this (so they stay below the killers)
+HISTORY_LIMIT = 10 ** 6
+# plies with killer move slots
+MAX_PLY = 128
+
+
+class MoveOrderer:
+    """Orders the moves of a search node so that alpha-beta cuts off as early as possible
+
+    1. the best move stored in the transposition table for the position (hash move)
+    2. captures by MVV-LVA (most valuable victim first, least valuable attacker first among equal victims)
+       using Piece.value (PIECE_VALUES), promotions count as capturing the new piece
+    3. killer moves: the last two quiet moves that caused a cutoff at the same ply of the search
+    4. the other quiet moves by their history score: how often and how deep they caused cutoffs anywhere
+
+    args:
+    promotion_values: dict {(piece type, color): Piece.value of the piece a pawn promotes to}, see
+        chess.PROMOTION_VALUES (None: a promotion counts as capturing nothing)
+    """
+    def __init__(self, promotion_values=None):
+        self.promotion_values = promotion_values or {}
+        self.killers = [[0, 0] for _ in range(MAX_PLY)]
+        self.history = {color: [[0] * 64 for _ in range(64)] for color in ("white", "black")}
+
+    def clear(self):
+        """forgets the killers and the history (e.g. at the start of a new game)"""
+        self.__init__(self.promotion_values)
+
+    def new_search(self):
+        """called once per move: killers of the previous move are dropped and the history is aged"""
+        self.killers = [[0, 0] for _ in range(MAX_PLY)]
+        for table in self.history.values():
+            for row in table:
+                for to_square in range(64):
+                    row[to_square] >>= 1
+
+    def order(self, moves, board, ply, hash_move=0):
+        """sorts moves (a list of Move) in place, best candidates first, and returns it
+        args:
+        board: Board, the position the moves are played from
+        ply: int, distance from the root of the search (for the killer moves)
+        hash_move: int, best move of the transposition table packed with transposition.encode_move (0 if none)
+        """
+        squares = board.squares
+        killer_1, killer_2 = self.killers[ply] if ply < MAX_PLY else (0, 0)
+        history = self.history[squares[moves[0].from_square].color] if moves else None
+        promotion_values = self.promotion_values
+
+        def score(move):
+            encoded = move.from_square | (move.to_square << 6)
+            if encoded == hash_move:
+                return HASH_MOVE_SCORE
+            if move.capture or move.promotion:
+                victim = squares[move.to_square].value if move.capture else 0
+                attacker = squares[move.from_square]
+                if move.promotion:
+                    victim += promotion_values.get((move.promotion, attacker.color), 0)
+                return CAPTURE_SCORE + 100 * victim - attacker.value
+            if encoded == killer_1:
+                return KILLER_SCORES[0]
+            if encoded == killer_2:
+                return KILLER_SCORES[1]
+            return history[move.from_square][move.to_square]
+
+        moves.sort(key=score, reverse=True)
+        return moves
+
+    def record_cutoff(self, move, color, depth, ply):
+        """remembers a quiet move that caused a beta cutoff as a killer of ply and in the history of color"""
+        if move.capture or move.promotion:
+            return
+        encoded = encode_move(move)
+        if ply < MAX_PLY:
+            killers = self.killers[ply]
+            if killers[0] != encoded:
+                killers[1] = killers[0]
+                killers[0] = encoded
+
+        row = self.history[color][move.from_square]
+        row[move.to_square] += depth * depth
+        if row[move.to_square] > HISTORY_LIMIT:
+            for history_row in self.history[color]:
+                for to_square in range(64):
+                    history_row[to_square] >>= 1
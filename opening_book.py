@@ -0,0 +1,127 @@
+import sys
+import random
+import collections
+import numpy as np
+from transposition import encode_move, find_move
+
+# Opening book: weighted moves of the first plies of recorded games, looked up by the position's Board.zobrist_key
+# (the keys come from a fixed seed, see zobrist.py, so a book stays valid between runs)
+#
+# The book is a numpy structured array saved as an .npy file, sorted by key and memory-mapped when loaded, so a lookup
+# is a binary search (np.searchsorted) that only reads the few pages it touches. One entry per (position, move):
+#   key: zobrist key of the position
+#   move: the move played from it, packed by transposition.encode_move
+#   weight: points the move scored for the player who made it, over the recorded games
+
+BOOK_PATH = "opening_book.npy"
+ENTRY_DTYPE = np.dtype([("key", "<u8"), ("move", "<u2"), ("weight", "<u4")])
+# number of plies of a game that go into (and are looked up in) the book
+MAX_BOOK_PLIES = 16
+# points of a recorded move by the result of its game for the player who made it: a move that only lost is left out
+RESULT_POINTS = {"win": 2, "tie": 1, "loss": 0}
+
+
+def game_record(board, winner=None, tie=False, max_plies=MAX_BOOK_PLIES):
+    """returns the first max_plies moves of a game played on board as (key, encoded move, points) tuples
+    args:
+    winner: Player who won the game (None if nobody did)
+    tie: bool, True if the game was a draw
+    """
+    record = []
+    for undo in board.move_history[:max_plies]:
+        if undo.move is None:
+            continue
+        if tie or winner is None:
+            result = "tie"
+        else:
+            result = "win" if undo.piece.color == winner.color else "loss"
+        record.append((undo.key, encode_move(undo.move), RESULT_POINTS[result]))
+    return record
+
+
+def build_book(records, path=BOOK_PATH, min_weight=1):
+    """sums the points of every (position, move) of the records and saves the book, returns its number of entries
+    args:
+    records: iterable of game_record outputs
+    min_weight: int, moves with fewer points are left out of the book
+    """
+    weights = collections.Counter()
+    for record in records:
+        for key, move, points in record:
+            weights[(key, move)] += points
+    entries = np.array(sorted((key, move, weight) for (key, move), weight in weights.items() if weight >= min_weight),
+                       dtype=ENTRY_DTYPE)
+    np.save(path, entries)
+    return len(entries)
+
+
+def self_play(n_games, player_1_options=None, player_2_options=None, adjudication=None, max_plies=MAX_BOOK_PLIES,
+              verbose=True):
+    """plays n_games between two robots and returns their game_record-s
+    args:
+    player_1_options, player_2_options: dict of keyword arguments of chess.Player (a depth 0 robot by default)
+    adjudication: chess.Adjudication, ends decided games early (chess.Adjudication() by default)
+    """
+    from chess import Player, Board, Adjudication
+    adjudication = adjudication or Adjudication()
+    records = []
+    for game in range(n_games):
+        player_1 = Player("white", **(player_1_options or {"engine": "robot", "max_depth": 0}))
+        player_2 = Player("black", **(player_2_options or {"engine": "robot", "max_depth": 0}))
+        board = Board(player_1, player_2)
+        winner, loser, tie = board.play(adjudication=adjudication, headless=True)
+        records.append(game_record(board, winner, tie, max_plies))
+        if verbose:
+            print(f"game {game + 1}/{n_games}: {board.termination}")
+    return records
+
+
+class OpeningBook:
+    """Memory-mapped opening book built by build_book, see the top of this module
+
+    args:
+    path: str, the .npy file of the book
+    max_plies: int, the book is not looked up after this many plies of a game
+    """
+    def __init__(self, path=BOOK_PATH, max_plies=MAX_BOOK_PLIES):
+        self.path = path
+        self.max_plies = max_plies
+        self.entries = np.load(path, mmap_mode="r")
+        self.keys = self.entries["key"]
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, key):
+        """returns the book moves of a position as a list of (encoded move, weight), empty if it is not in the book"""
+        key = np.uint64(key)
+        start = np.searchsorted(self.keys, key, side="left")
+        end = np.searchsorted(self.keys, key, side="right")
+        return [(int(entry["move"]), int(entry["weight"])) for entry in self.entries[start:end]]
+
+    def choose(self, board, rng=random):
+        """returns a legal Move of the player to move on board drawn from the book by weight,
+        None when out of book (position not in the book or past max_plies)
+        """
+        if len(board.move_history) >= self.max_plies:
+            return None
+        book_moves = self.lookup(board.zobrist_key)
+        if book_moves:
+            # the legal moves guard against a key collision with a position that has other moves
+            legal_moves = board.side_to_move.generate_legal_moves()
+            candidates = [(find_move(legal_moves, move), weight) for move, weight in book_moves]
+            candidates = [(move, weight) for move, weight in candidates if move is not None]
+            if candidates:
+                self.hits += 1
+                moves, weights = zip(*candidates)
+                return rng.choices(moves, weights=weights)[0]
+        self.misses += 1
+        return None
+
+
+if __name__ == '__main__':
+    # python opening_book.py [n_games]: builds BOOK_PATH from n_games (100 by default) of self-play
+    n_entries = build_book(self_play(int(sys.argv[1]) if len(sys.argv) > 1 else 100))
+    print(f"{n_entries} entries written to {BOOK_PATH}")
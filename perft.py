@@ -0,0 +1,148 @@
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from bitboard import square_position
+from transposition import encode_move, find_move
+
+# Perft: the number of leaf positions of the move tree to a fixed depth, the standard check of a move generator
+# A change of Player.generate_legal_moves / Board.make_move / Board.unmake_move has to keep the node counts of
+# EXPECTED_NODES, and its speed shows in the nodes per second
+#
+# Positions are given like STARTING_POSITIONS: {(name, color): (x, y)} with the side to move, see Board.set_position
+
+POSITIONS = {
+    # STARTING_POSITIONS
+    "start": (None, "white"),
+    # a rook and pawn ending with checks and pins along the 4th and 5th rows
+    # (position 3 of the usual perft suites: 8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w)
+    "rook ending": ({("king", "white"): (1, 5), ("pawn_2", "white"): (2, 5), ("rook_1", "white"): (2, 4),
+                     ("pawn_5", "white"): (5, 2), ("pawn_7", "white"): (7, 2),
+                     ("king", "black"): (8, 4), ("rook_2", "black"): (8, 5), ("pawn_6", "black"): (6, 4),
+                     ("pawn_3", "black"): (3, 7), ("pawn_4", "black"): (4, 6)}, "white"),
+    # pawns one step from promotion on both sides, with captures onto the last row
+    "promotion": ({("king", "white"): (5, 3), ("knight_1", "white"): (4, 1), ("pawn_2", "white"): (2, 7),
+                   ("pawn_7", "white"): (7, 7), ("king", "black"): (5, 8), ("rook_1", "black"): (1, 8),
+                   ("bishop_2", "black"): (8, 8), ("pawn_3", "black"): (3, 2), ("pawn_7", "black"): (7, 2)}, "black"),
+}
+
+# node counts by position and depth (1, 2, ...)
+# standard chess counts without the castling and en passant moves, and with promotion to the first missing piece
+# (Pawn.promotion_type) instead of a choice of four
+EXPECTED_NODES = {
+    "start": (20, 400, 8902, 197281, 4865351),
+    "rook ending": (14, 191, 2810, 43087, 671300),
+    "promotion": (18, 219, 3873, 51557, 1019894),
+}
+
+
+def make_board(position="start"):
+    """returns a Board of two robot players set up at one of POSITIONS"""
+    from chess import Player, Board
+    positions, side_to_move = POSITIONS[position]
+    board = Board(Player("white", "robot", max_depth=0), Player("black", "robot", max_depth=0))
+    if positions is not None:
+        board.set_position(positions, side_to_move)
+    return board
+
+
+def perft(board, depth):
+    """returns the number of positions depth plies below the position of board (which is left as it was found)"""
+    moves = board.side_to_move.generate_legal_moves()
+    if depth <= 1:
+        # bulk counting: the leaves are not played
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        board.make_move(move)
+        nodes += perft(board, depth - 1)
+        board.unmake_move()
+    return nodes
+
+
+def move_name(board, move):
+    """returns a readable name of a Move in the position of board, e.g. w_p5 (5, 2)->(5, 4)"""
+    return f"{board.squares[move.from_square]} {tuple(square_position(move.from_square).tolist())}->" \
+           f"{tuple(square_position(move.to_square).tolist())}"
+
+
+def divide(board, depth):
+    """returns {move name: number of positions depth - 1 plies after the move} for every legal move of board"""
+    counts = {}
+    for move in board.side_to_move.generate_legal_moves():
+        board.make_move(move)
+        nodes = perft(board, depth - 1)
+        board.unmake_move()
+        counts[move_name(board, move)] = nodes
+    return counts
+
+
+# board of a pool worker, set up once per process by init_worker
+_worker_board = None
+
+
+def init_worker(position):
+    global _worker_board
+    _worker_board = make_board(position)
+
+
+def perft_after(encoded_move, depth):
+    """pool task: returns the perft of the worker's board after an encoded root move"""
+    board = _worker_board
+    move = find_move(board.side_to_move.generate_legal_moves(), encoded_move)
+    board.make_move(move)
+    nodes = perft(board, depth - 1)
+    board.unmake_move()
+    return nodes
+
+
+def parallel_divide(position, depth, processes):
+    """divide of one of POSITIONS with the root moves shared out over a pool of processes"""
+    board = make_board(position)
+    moves = board.side_to_move.generate_legal_moves()
+    with ProcessPoolExecutor(processes, initializer=init_worker, initargs=(position,)) as pool:
+        nodes = pool.map(perft_after, [encode_move(move) for move in moves], [depth] * len(moves))
+        return {move_name(board, move): count for move, count in zip(moves, nodes)}
+
+
+def run(position="start", depth=3, processes=None, show_divide=False):
+    """counts the nodes of position to depth, prints them with the speed (and the divide counts if show_divide)
+    returns (nodes, seconds, True / False if the count matches EXPECTED_NODES or None if there is none to compare)
+    args:
+    processes: int, size of the process pool the root moves are shared out over (None: no pool)
+    """
+    board = make_board(position)
+    start = time.perf_counter()
+    if processes or show_divide:
+        counts = parallel_divide(position, depth, processes) if processes else divide(board, depth)
+        nodes = sum(counts.values())
+    else:
+        counts = None
+        nodes = perft(board, depth)
+    seconds = time.perf_counter() - start
+
+    if counts is not None and show_divide:
+        for name, count in sorted(counts.items()):
+            print(f"  {name}: {count}")
+    expected = EXPECTED_NODES.get(position, ())
+    correct = None
+    check = ""
+    if depth <= len(expected):
+        correct = expected[depth - 1] == nodes
+        check = " ok" if correct else f" WRONG, expected {expected[depth - 1]}"
+    print(f"{position} depth {depth}: {nodes} nodes in {seconds:.2f}s ({nodes / max(seconds, 1e-9):.0f} nodes/s)"
+          + check)
+    return nodes, seconds, correct
+
+
+if __name__ == '__main__':
+    # python perft.py [depth] [--position name] [--divide] [--processes n]
+    parser = argparse.ArgumentParser(description="counts the positions of the move tree to a fixed depth")
+    parser.add_argument("depth", type=int, nargs="?", default=3)
+    parser.add_argument("--position", choices=list(POSITIONS) + ["all"], default="all")
+    parser.add_argument("--divide", action="store_true", help="print the node count after each root move")
+    parser.add_argument("--processes", type=int, default=None, help="share the root moves out over a process pool")
+    args = parser.parse_args()
+    results = [run(position, args.depth, args.processes, args.divide)
+               for position in (POSITIONS if args.position == "all" else [args.position])]
+    if any(correct is False for _, _, correct in results):
+        raise SystemExit(1)
@@ -0,0 +1,192 @@
+import os
+import sys
+import json
+import time
+import argparse
+import functools
+import importlib
+import threading
+import collections
+
+# Opt-in profiling of where a game spends its time
+# Profiler.enable() wraps the functions of its targets so that every call records a span (name, start, duration),
+# Profiler.disable() puts the original functions back: while it is off nothing is wrapped, so it costs nothing
+#
+#   with Profiler() as profiler:
+#       board.play(show=False, verbose=False)
+#   profiler.print_table()
+#   profiler.save_chrome_trace("trace.json")   # open in chrome://tracing or https://ui.perfetto.dev
+#
+# Spans are grouped by game: every call of Board.play starts a new one
+
+# "module.Class.attribute" of the functions profiled by default (properties are profiled through their getter),
+# others can be given to Profiler, e.g. "search.Searcher.quiescence" or "search.Searcher.evaluate"
+# An inherited function is profiled on the class that defines it: its spans are named after that class
+DEFAULT_TARGETS = (
+    "chess.Board.play",
+    "chess.Player.choose_move",
+    "chess.Player.generate_legal_moves",
+    "chess.Player.calculate_score",
+    "chess.Player.pin_analysis",
+    "chess.Board.game_status",
+    "chess.Board.make_move",
+    "chess.Board.unmake_move",
+    "chess.Board.update_board",
+    "chess.Board.__repr__",
+    "search.Searcher.negamax",
+    "deep_learning.NeuralNet.forward_pass",
+)
+# the call that starts a new game
+GAME_TARGET = "chess.Board.play"
+
+# One recorded call
+# name: target without the module, e.g. "Board.play", game: number of the game (0 before the first Board.play),
+# start, duration, self_duration: seconds (self_duration leaves out the time of the profiled calls made inside),
+# depth: number of profiled calls it was made in
+Span = collections.namedtuple("Span", ["name", "game", "start", "duration", "self_duration", "depth"])
+
+
+class Profiler:
+    """Records a Span for every call of the target functions while enabled, see the top of this module
+
+    args:
+    targets: iterable of "module.Class.attribute" strings
+    """
+    def __init__(self, targets=DEFAULT_TARGETS):
+        self.targets = tuple(targets)
+        self.spans = []
+        self.game = 0
+        self.origin = time.perf_counter()
+        # (class, attribute, original value) of the wrapped functions
+        self.originals = []
+        # open calls: [start, time of the profiled calls made inside]
+        self.stack = []
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.disable()
+
+    @property
+    def enabled(self):
+        return bool(self.originals)
+
+    def enable(self):
+        """wraps the target functions (again after disable: the new spans are added to the old ones)"""
+        if self.enabled:
+            return
+        for target in self.targets:
+            module_name, class_name, attribute = target.rsplit(".", 2)
+            cls = getattr(importlib.import_module(module_name), class_name)
+            # an inherited function is wrapped (and put back) on the class of the MRO that defines it
+            cls = next((owner for owner in cls.__mro__ if attribute in owner.__dict__), None)
+            if cls is None:
+                raise AttributeError(f"{target} not found")
+            if any(owner is cls and name == attribute for owner, name, _ in self.originals):
+                # e.g. "chess.Pawn.attacks" after "chess.Piece.attacks": already wrapped
+                continue
+            original = cls.__dict__[attribute]
+            name = f"{cls.__name__}.{attribute}"
+            if isinstance(original, property):
+                wrapped = property(self.wrap(original.fget, name, target == GAME_TARGET), original.fset, original.fdel,
+                                   original.__doc__)
+            elif isinstance(original, staticmethod):
+                wrapped = staticmethod(self.wrap(original.__func__, name, target == GAME_TARGET))
+            else:
+                wrapped = self.wrap(original, name, target == GAME_TARGET)
+            self.originals.append((cls, attribute, original))
+            setattr(cls, attribute, wrapped)
+
+    def disable(self):
+        """puts the original functions back"""
+        for cls, attribute, original in reversed(self.originals):
+            setattr(cls, attribute, original)
+        self.originals = []
+
+    def wrap(self, function, name, new_game=False):
+        """returns function recording a Span of every call"""
+        spans = self.spans
+        stack = self.stack
+        clock = time.perf_counter
+
+        @functools.wraps(function)
+        def profiled(*args, **kwargs):
+            if new_game:
+                self.game += 1
+            frame = [clock(), 0.0]
+            stack.append(frame)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                end = clock()
+                stack.pop()
+                duration = end - frame[0]
+                if stack:
+                    stack[-1][1] += duration
+                spans.append(Span(name, self.game, frame[0] - self.origin, duration, duration - frame[1], len(stack)))
+        return profiled
+
+    def clear(self):
+        self.spans.clear()
+        self.game = 0
+
+    def table(self, per_game=True):
+        """returns the spans added up by name (and game if per_game), slowest first, as a list of dicts:
+        game, name, calls, total (seconds), self (seconds), mean (seconds per call)
+        """
+        rows = {}
+        for span in self.spans:
+            key = (span.game if per_game else None, span.name)
+            row = rows.setdefault(key, {"game": key[0], "name": span.name, "calls": 0, "total": 0.0, "self": 0.0})
+            row["calls"] += 1
+            row["total"] += span.duration
+            row["self"] += span.self_duration
+        for row in rows.values():
+            row["mean"] = row["total"] / row["calls"]
+        return sorted(rows.values(), key=lambda row: (row["game"] or 0, -row["self"]))
+
+    def print_table(self, per_game=True, file=None):
+        """prints table(per_game): the functions where each game spent its own time (self) come first"""
+        file = file or sys.stdout
+        game = object()
+        for row in self.table(per_game):
+            if row["game"] != game:
+                game = row["game"]
+                print(f"{'game ' + str(game) if per_game else 'all games'}:", file=file)
+                print(f"  {'name':<34}{'calls':>10}{'total ms':>12}{'self ms':>12}{'mean us':>12}", file=file)
+            print(f"  {row['name']:<34}{row['calls']:>10}{1000 * row['total']:>12.1f}{1000 * row['self']:>12.1f}"
+                  f"{1e6 * row['mean']:>12.1f}", file=file)
+
+    def chrome_trace(self):
+        """returns the spans in the Chrome trace event format (complete events, times in microseconds)"""
+        pid = os.getpid()
+        tid = threading.get_ident()
+        events = [{"name": span.name, "cat": f"game {span.game}", "ph": "X", "ts": 1e6 * span.start,
+                   "dur": 1e6 * span.duration, "pid": pid, "tid": tid, "args": {"game": span.game}}
+                  for span in sorted(self.spans, key=lambda span: (span.start, span.depth))]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save_chrome_trace(self, path):
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+
+if __name__ == '__main__':
+    # python profiling.py [--games n] [--trace trace.json]: profiles robot self-play games
+    parser = argparse.ArgumentParser(description="profiles robot self-play games")
+    parser.add_argument("--games", type=int, default=1)
+    parser.add_argument("--max-steps", type=int, default=200)
+    parser.add_argument("--trace", help="write the spans to this Chrome trace JSON file")
+    args = parser.parse_args()
+
+    from chess import Player, Board
+    with Profiler() as profiler:
+        for _ in range(args.games):
+            board = Board(Player("white", "robot", max_depth=0), Player("black", "robot", max_depth="adaptive"),
+                          max_steps=args.max_steps)
+            board.play(show=False, verbose=False)
+    profiler.print_table()
+    if args.trace:
+        profiler.save_chrome_trace(args.trace)
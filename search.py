@@ -0,0 +1,436 @@
+import time
+import collections
+import evaluation
+from bitboard import square_position
+from transposition import TranspositionTable, encode_move, EXACT, LOWER, UPPER
+from move_ordering import MoveOrderer
+from tablebase import MAX_PIECES, plies_to_mate
+
+# Scores are in centi-pawns from the point of view of the player to move
+MATE_SCORE = 100000
+# scores beyond +-MATE_BOUND are mates, stored in the transposition table relative to the node instead of the root
+MATE_BOUND = MATE_SCORE - 1000
+INFINITY = 1000000
+# deepest iteration when only a time or node budget limits the search
+MAX_DEPTH = 64
+# the clock is read once every CLOCK_INTERVAL nodes
+CLOCK_INTERVAL = 256
+# delta pruning: a capture is skipped if even winning the victim plus this margin cannot raise alpha
+DELTA_MARGIN = 200
+# the quiescence search stops extending at this distance from the root
+MAX_PLY = 128
+# null-move pruning: the pass is searched NULL_MOVE_REDUCTION plies shallower, from NULL_MOVE_MIN_DEPTH plies
+NULL_MOVE_REDUCTION = 2
+NULL_MOVE_MIN_DEPTH = 3
+# late-move reductions: quiet moves after the first LMR_FULL_MOVES are searched one ply shallower, from LMR_MIN_DEPTH
+LMR_FULL_MOVES = 4
+LMR_MIN_DEPTH = 3
+# aspiration windows: each iteration first searches previous score +- ASPIRATION_WINDOW
+ASPIRATION_WINDOW = 50
+
+
+def score_to_table(score, ply):
+    """mate scores count plies from the root, in the transposition table they count from the stored node"""
+    if score > MATE_BOUND:
+        return score + ply
+    if score < -MATE_BOUND:
+        return score - ply
+    return score
+
+
+def score_from_table(score, ply):
+    """inverse of score_to_table"""
+    if score > MATE_BOUND:
+        return score - ply
+    if score < -MATE_BOUND:
+        return score + ply
+    return score
+
+
+# What the search behind one move (or, added up by aggregate_stats, a game) did, see Player.choose_move(with_stats=True)
+# nodes: positions searched, depth: plies searched (mean over the moves of a game),
+# branching_factor: effective branching factor nodes ** (1 / depth), tt_probes / tt_hits: transposition table lookups,
+# cutoffs: beta cutoffs, movegen_seconds / evaluation_seconds: time spent generating moves / evaluating positions
+SearchStats = collections.namedtuple("SearchStats", ["nodes", "seconds", "nodes_per_second", "depth",
+                                                     "branching_factor", "tt_probes", "tt_hits", "cutoffs",
+                                                     "movegen_seconds", "evaluation_seconds"])
+
+
+class SearchCounters:
+    """Counters of the search of one move, kept on Board.search_counters while the move is chosen
+    (None the rest of the time, so that the hot paths only pay for a None check when no stats are asked for)
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        # positions searched by look_forward (the alpha-beta Searcher counts its own nodes)
+        self.nodes = 0
+        self.movegen_seconds = 0.0
+        self.evaluation_seconds = 0.0
+
+    def stats(self, nodes, depth, tt_probes=0, tt_hits=0, cutoffs=0):
+        """returns the SearchStats of the search from its counters and the given totals"""
+        seconds = time.perf_counter() - self.start
+        return SearchStats(nodes, seconds, nodes / seconds if seconds else 0.0, depth, branching_factor(nodes, depth),
+                           tt_probes, tt_hits, cutoffs, self.movegen_seconds, self.evaluation_seconds)
+
+
+def branching_factor(nodes, depth):
+    """returns the effective branching factor: the number of moves per position a tree of nodes positions
+    depth plies deep would have (0 if nothing was searched)"""
+    return nodes ** (1 / depth) if nodes and depth else 0.0
+
+
+def aggregate_stats(stats):
+    """returns the SearchStats of a list of SearchStats (the moves of a game): totals, with the mean depth and
+    branching factor (None if the list is empty)"""
+    if not stats:
+        return None
+    nodes = sum(move.nodes for move in stats)
+    seconds = sum(move.seconds for move in stats)
+    return SearchStats(nodes, seconds, nodes / seconds if seconds else 0.0,
+                       sum(move.depth for move in stats) / len(stats),
+                       sum(move.branching_factor for move in stats) / len(stats),
+                       sum(move.tt_probes for move in stats), sum(move.tt_hits for move in stats),
+                       sum(move.cutoffs for move in stats), sum(move.movegen_seconds for move in stats),
+                       sum(move.evaluation_seconds for move in stats))
+
+
+class SearchAborted(Exception):
+    """raised inside the search when the time or node budget of the move has run out"""
+    pass
+
+
+class Searcher:
+    """Negamax search with alpha-beta pruning for the robot player (Player(..., search="alphabeta"))
+
+    The search deepens iteratively (1, 2, ... plies) until max_depth or until the time / node budget runs out,
+    and plays the best move of the last completed iteration
+    The board is searched in place with Board.make_move / Board.unmake_move, so it is left as it was found
+
+    args:
+    time_limit_ms: int, thinking time per move in milliseconds (None for no limit)
+    node_limit: int, number of searched positions per move (None for no limit)
+    tt_size_mb: float, memory of the transposition table in megabytes (0 or None: no table)
+    quiescence: bool, resolve the captures at the leaves with quiescence() instead of evaluating them as they are
+    null_move: bool, null-move pruning: if passing the turn still fails high, the node is cut without searching it
+    lmr: bool, late-move reductions: quiet moves ordered late are searched shallower first
+    pvs: bool, principal variation search: moves after the first are searched with a null window first
+    aspiration: bool, iterations start with a window around the score of the previous iteration
+    tablebase: tablebase.Tablebase, exact scores of the positions with few pieces left (None: search them too)
+    promotion_values: dict {(piece type, color): value of the promoted piece} of the move ordering, see MoveOrderer
+    """
+    def __init__(self, player, time_limit_ms=None, node_limit=None, tt_size_mb=16, quiescence=True, null_move=True,
+                 lmr=True, pvs=True, aspiration=True, tablebase=None, promotion_values=None):
+        self.player = player
+        self.time_limit_ms = time_limit_ms
+        self.node_limit = node_limit
+        self.quiescence_enabled = quiescence
+        self.null_move = null_move
+        self.lmr = lmr
+        self.pvs = pvs
+        self.aspiration = aspiration
+        self.tablebase = tablebase
+        # positions already searched (possibly through another move order), kept between moves of a game
+        self.tt = TranspositionTable(tt_size_mb) if tt_size_mb else None
+        # hash move, MVV-LVA captures, killers and history
+        self.orderer = MoveOrderer(promotion_values)
+        self.nodes = 0
+        # beta cutoffs (null-move cutoffs included) of the current move, see SearchStats
+        self.cutoffs = 0
+        # transposition table probes and hits before the current move
+        self.tt_start = (0, 0)
+        self.depth_reached = 0
+        self.deadline = None
+
+    @staticmethod
+    def evaluate(player):
+        """returns the static score of the position for player in centi-pawns (see evaluation.evaluate)"""
+        counters = player.board.search_counters
+        if counters is None:
+            return evaluation.evaluate(player)
+        start = time.perf_counter()
+        score = evaluation.evaluate(player)
+        counters.evaluation_seconds += time.perf_counter() - start
+        return score
+
+    def negamax(self, player, depth, alpha, beta, ply, allow_null=True):
+        """returns the score of the position for player (who is to move), searching depth more plies
+        args:
+        alpha, beta: the window of scores that can still change the choice higher up in the tree
+        ply: distance from the root, so that shorter mates score higher
+        allow_null: bool, False right after a null move (two passes in a row would search nothing)
+        """
+        if depth <= 0:
+            if self.quiescence_enabled:
+                return self.quiescence(player, alpha, beta, ply)
+            self.nodes += 1
+            self.check_budget()
+            return self.evaluate(player)
+        self.nodes += 1
+        self.check_budget()
+        if ply > 0:
+            score = self.probe_tablebase(player, ply)
+            if score is not None:
+                return score
+
+        board = player.board
+        key = board.zobrist_key
+        tt = self.tt
+        hash_move = 0
+        if tt is not None:
+            entry = tt.probe(key)
+            if entry is not None:
+                tt_depth, bound, tt_score, hash_move = entry
+                if tt_depth >= depth:
+                    tt_score = score_from_table(tt_score, ply)
+                    if bound == EXACT or (bound == LOWER and tt_score >= beta) or (bound == UPPER and tt_score <= alpha):
+                        return tt_score
+
+        in_check = player.in_check
+        if (self.null_move and allow_null and not in_check and depth >= NULL_MOVE_MIN_DEPTH
+                and abs(beta) < MATE_BOUND and self.has_pieces(player) and self.evaluate(player) >= beta):
+            # if we are still above beta after letting the opponent move twice, a real move will be too
+            board.make_null_move()
+            score = -self.negamax(player.opponent, depth - 1 - NULL_MOVE_REDUCTION, -beta, -beta + 1, ply + 1,
+                                  allow_null=False)
+            board.unmake_move()
+            if score >= beta:
+                self.cutoffs += 1
+                return beta
+
+        moves = player.generate_legal_moves()
+        if not moves:
+            # checkmate or stalemate
+            return -MATE_SCORE + ply if in_check else 0
+
+        original_alpha = alpha
+        best_score = -INFINITY
+        best_move = None
+        for index, move in enumerate(self.orderer.order(moves, board, ply, hash_move)):
+            board.make_move(move)
+            if index == 0:
+                score = -self.negamax(player.opponent, depth - 1, -beta, -alpha, ply + 1)
+            else:
+                score = self.search_late_move(player, move, index, depth, alpha, beta, ply, in_check)
+            board.unmake_move()
+
+            if score > best_score:
+                best_score = score
+                best_move = move
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        # the opponent will avoid this position, no need to look at the other moves
+                        self.orderer.record_cutoff(move, player.color, depth, ply)
+                        self.cutoffs += 1
+                        break
+
+        if tt is not None:
+            if best_score <= original_alpha:
+                bound = UPPER
+            elif best_score >= beta:
+                bound = LOWER
+            else:
+                bound = EXACT
+            tt.store(key, depth, bound, score_to_table(best_score, ply), encode_move(best_move))
+        return best_score
+
+    def search_late_move(self, player, move, index, depth, alpha, beta, ply, in_check):
+        """returns the score for player of a move after the first one (already made on the board)
+        the move is searched reduced (late quiet move) and / or with a null window first, and searched again with the
+        full depth and window only if it may beat alpha
+        """
+        opponent = player.opponent
+        reduction = 0
+        if (self.lmr and index >= LMR_FULL_MOVES and depth >= LMR_MIN_DEPTH and not in_check
+                and not move.capture and not move.promotion and not opponent.in_check):
+            reduction = 1
+        window_beta = alpha + 1 if self.pvs else beta
+
+        score = -self.negamax(opponent, depth - 1 - reduction, -window_beta, -alpha, ply + 1)
+        if reduction and score > alpha:
+            score = -self.negamax(opponent, depth - 1, -window_beta, -alpha, ply + 1)
+        if window_beta != beta and alpha < score < beta:
+            score = -self.negamax(opponent, depth - 1, -beta, -alpha, ply + 1)
+        return score
+
+    @staticmethod
+    def has_pieces(player):
+        """True if player has anything but king and pawns (with only those a pass may be the best move: zugzwang)"""
+        bitboard = player.board.bitboard
+        color = player.color
+        return bitboard.colors[color] != bitboard.pieces[(color, "pawn")] | bitboard.pieces[(color, "king")]
+
+    def quiescence(self, player, alpha, beta, ply):
+        """returns the score of a leaf position for player once the captures on the board have been played out
+        only captures and promotions are searched (every move if player is in check), the player not in check may
+        also stop capturing and take the static evaluation (stand pat)
+        """
+        self.nodes += 1
+        self.check_budget()
+        score = self.probe_tablebase(player, ply)
+        if score is not None:
+            return score
+        board = player.board
+        in_check = player.in_check
+        if in_check:
+            # every move has to be searched: none of them may leave the king in check
+            moves = player.generate_legal_moves()
+            if not moves:
+                return -MATE_SCORE + ply
+            best_score = -INFINITY
+        else:
+            best_score = self.evaluate(player)
+            if best_score >= beta or ply >= MAX_PLY:
+                return best_score
+            alpha = max(alpha, best_score)
+            moves = player.generate_legal_moves(captures_only=True)
+            if not moves:
+                return best_score
+
+        stand_pat = best_score
+        for move in self.orderer.order(moves, board, ply):
+            if not in_check and not move.promotion:
+                # delta pruning: the capture cannot bring the score back above alpha
+                victim = board.squares[move.to_square].value if move.capture else 0
+                if stand_pat + 100 * victim + DELTA_MARGIN <= alpha:
+                    continue
+            board.make_move(move)
+            score = -self.quiescence(player.opponent, -beta, -alpha, ply + 1)
+            board.unmake_move()
+
+            if score > best_score:
+                best_score = score
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        self.cutoffs += 1
+                        break
+        return best_score
+
+    def probe_tablebase(self, player, ply):
+        """returns the exact score for player (who is to move) from the tablebase, None if the position is not in it
+        a win in n plies scores as a mate n plies after this node
+        """
+        if self.tablebase is None or player.board.bitboard.occupied.bit_count() > MAX_PIECES:
+            return None
+        value = self.tablebase.probe(player.board)
+        if value is None:
+            return None
+        if value > 0:
+            return MATE_SCORE - ply - plies_to_mate(value)
+        if value < 0:
+            return -MATE_SCORE + ply + plies_to_mate(value)
+        return 0
+
+    def check_budget(self):
+        """raises SearchAborted once the node budget or (checked every CLOCK_INTERVAL nodes) the time is used up"""
+        if self.node_limit is not None and self.nodes > self.node_limit:
+            raise SearchAborted
+        if self.deadline is not None and self.nodes % CLOCK_INTERVAL == 0 and time.perf_counter() > self.deadline:
+            raise SearchAborted
+
+    def search(self, depth, best_first=None, alpha=-INFINITY, beta=INFINITY):
+        """returns the best Move of self.player and its score, searching depth plies ahead (None if no legal move)
+        args:
+        best_first: Move, searched first (the best move of the previous iteration)
+        alpha, beta: the aspiration window, the score is only a bound if it falls outside it
+        """
+        player = self.player
+        board = player.board
+        original_alpha = alpha
+        best_score = -INFINITY
+        best_move = None
+
+        in_check = player.in_check
+        moves = self.orderer.order(player.generate_legal_moves(), board, 0, encode_move(best_first) if best_first else 0)
+        for index, move in enumerate(moves):
+            board.make_move(move)
+            if index == 0:
+                score = -self.negamax(player.opponent, depth - 1, -beta, -alpha, 1)
+            else:
+                score = self.search_late_move(player, move, index, depth, alpha, beta, 0, in_check)
+            board.unmake_move()
+
+            if score > best_score:
+                best_score = score
+                best_move = move
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+
+        if self.tt is not None and best_move is not None:
+            if best_score <= original_alpha:
+                bound = UPPER
+            elif best_score >= beta:
+                bound = LOWER
+            else:
+                bound = EXACT
+            self.tt.store(board.zobrist_key, depth, bound, score_to_table(best_score, 0), encode_move(best_move))
+        return best_move, best_score
+
+    def iterative_deepening(self, max_depth=None):
+        """returns the best Move and its score from the deepest iteration completed within the budget
+        (the first legal move if not even depth 1 could be completed, None if there is no legal move)
+        """
+        board = self.player.board
+        root_history = len(board.move_history)
+        self.nodes = 0
+        self.cutoffs = 0
+        self.depth_reached = 0
+        self.deadline = None
+        if self.time_limit_ms is not None:
+            self.deadline = time.perf_counter() + self.time_limit_ms / 1000
+        if self.tt is not None:
+            self.tt.new_search()
+            self.tt_start = (self.tt.probes, self.tt.hits)
+        self.orderer.new_search()
+
+        best_move, best_score = None, 0
+        for depth in range(1, (max_depth or MAX_DEPTH) + 1):
+            alpha, beta = -INFINITY, INFINITY
+            if self.aspiration and depth > 1 and abs(best_score) < MATE_BOUND:
+                alpha, beta = best_score - ASPIRATION_WINDOW, best_score + ASPIRATION_WINDOW
+            try:
+                while True:
+                    move, score = self.search(depth, best_first=best_move, alpha=alpha, beta=beta)
+                    # outside the aspiration window the score is only a bound: search again with that side open
+                    if score <= alpha and alpha > -INFINITY:
+                        alpha = -INFINITY
+                    elif score >= beta and beta < INFINITY:
+                        beta = INFINITY
+                    else:
+                        break
+            except SearchAborted:
+                # take back the moves of the interrupted iteration
+                while len(board.move_history) > root_history:
+                    board.unmake_move()
+                break
+
+            best_move, best_score = move, score
+            self.depth_reached = depth
+            if move is None or abs(score) > MATE_BOUND:
+                # no legal move or a forced mate was found: deeper iterations will not change the choice
+                break
+
+        self.deadline = None
+        if best_move is None:
+            moves = self.player.generate_legal_moves()
+            if moves:
+                best_move = self.orderer.order(moves, board, 0)[0]
+        return best_move, best_score
+
+    def choose_move(self, max_depth=None):
+        """returns (piece, new_pos) like Player.look_forward, or (None, None) if there is no legal move"""
+        best_move, score = self.iterative_deepening(max_depth)
+        if best_move is None:
+            return None, None
+        return self.player.board.squares[best_move.from_square], square_position(best_move.to_square)
+
+    def stats(self, counters):
+        """returns the SearchStats of the last move from its SearchCounters and the counts of the search"""
+        tt_probes = tt_hits = 0
+        if self.tt is not None:
+            tt_probes, tt_hits = self.tt.probes - self.tt_start[0], self.tt.hits - self.tt_start[1]
+        return counters.stats(self.nodes, self.depth_reached, tt_probes, tt_hits, self.cutoffs)
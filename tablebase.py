@@ -0,0 +1,348 @@
+import os
+import sys
+import time
+import collections
+import numpy as np
+from bitboard import piece_attacks, iter_squares, other_color, PAWN_ATTACKS
+
+# Endgame tablebases: the exact result of every position with at most MAX_PIECES pieces (kings included) and a given
+# material (signature, e.g. "KQvK": king and queen against a lone king), worked out offline by retrograde analysis
+# under the rules of this project (no castling or en passant, promotion to the first missing piece type)
+#
+# One table per signature, a numpy int8 array saved as <directory>/<signature>.npy and memory-mapped when probed
+# value of a position for the player to move:
+#   0: draw
+#   n > 0: win, mate in n - 1 plies
+#   n < 0: loss, mated in -n - 1 plies (-1: mated now)
+#
+# In a table the first side of the signature (the stronger one) plays white, positions where it is black are mirrored
+# (y -> 9 - y) so its pawns still move up. Index of a position: side to move (0: first side), then the squares of
+# the pieces in signature order (same pieces by ascending square), as digits of a base 64 number
+
+MAX_PIECES = 4
+TABLEBASE_DIRECTORY = "tablebases"
+# tables built by default (python tablebase.py): every 3 piece ending
+DEFAULT_SIGNATURES = ("KQvK", "KRvK", "KBvK", "KNvK", "KPvK")
+# order of the pieces of a side in a signature
+TYPE_ORDER = ("king", "queen", "rook", "bishop", "knight", "pawn")
+TYPE_LETTERS = {"king": "K", "queen": "Q", "rook": "R", "bishop": "B", "knight": "N", "pawn": "P"}
+LETTER_TYPES = {letter: piece_type for piece_type, letter in TYPE_LETTERS.items()}
+# weights deciding the stronger (first) side of a signature
+TYPE_WEIGHTS = {"king": 0, "queen": 9, "rook": 5, "bishop": 3, "knight": 3, "pawn": 1}
+# longest distance to mate that fits the int8 values
+MAX_PLIES = 126
+
+
+def side_letters(pieces, color):
+    """returns the letters of color's pieces in signature order, e.g. "KQ"
+    args:
+    pieces: list of (color, piece_type, square)
+    """
+    types = sorted((piece_type for piece_color, piece_type, _ in pieces if piece_color == color), key=TYPE_ORDER.index)
+    return "".join(TYPE_LETTERS[piece_type] for piece_type in types)
+
+
+def side_strength(letters):
+    return sum(TYPE_WEIGHTS[LETTER_TYPES[letter]] for letter in letters), len(letters), letters
+
+
+def position_index(pieces, side_to_move):
+    """returns the signature of a position and its index in the table of that signature
+    args:
+    pieces: list of (color, piece_type, square)
+    side_to_move: str, color of the player to move
+    """
+    white, black = side_letters(pieces, "white"), side_letters(pieces, "black")
+    if side_strength(black) > side_strength(white):
+        first, flip, signature = "black", 56, f"{black}v{white}"
+    else:
+        first, flip, signature = "white", 0, f"{white}v{black}"
+    index = 0 if side_to_move == first else 1
+    for color in (first, other_color(first)):
+        for _, square in sorted((TYPE_ORDER.index(piece_type), square ^ flip)
+                                for piece_color, piece_type, square in pieces if piece_color == color):
+            index = index * 64 + square
+    return signature, index
+
+
+def signature_slots(signature):
+    """returns the (color, piece_type) of every piece of a table in index order"""
+    first, second = signature.split("v")
+    return ([("white", LETTER_TYPES[letter]) for letter in first] +
+            [("black", LETTER_TYPES[letter]) for letter in second])
+
+
+def slot_index(pieces, side_to_move):
+    """returns the table index of pieces listed in slot order (the same as position_index if no side has two pieces
+    of the same type, without working out the signature)
+    """
+    index = 0 if side_to_move == "white" else 1
+    for _, _, square in pieces:
+        index = index * 64 + square
+    return index
+
+
+def decode_index(index, slots):
+    """returns the pieces [(color, piece_type, square)] and the color to move of a table index"""
+    squares = []
+    for _ in slots:
+        squares.append(index & 63)
+        index >>= 6
+    squares.reverse()
+    pieces = [(color, piece_type, square) for (color, piece_type), square in zip(slots, squares)]
+    return pieces, "white" if index == 0 else "black"
+
+
+def occupancy(pieces):
+    occupied = 0
+    for _, _, square in pieces:
+        occupied |= 1 << square
+    return occupied
+
+
+def in_check(pieces, color, occupied):
+    """returns True if the king of color is attacked"""
+    king = next(square for piece_color, piece_type, square in pieces if piece_color == color and piece_type == "king")
+    opponent_color = other_color(color)
+    for piece_color, piece_type, square in pieces:
+        if piece_color == opponent_color and (piece_attacks(piece_type, piece_color, square, occupied) >> king) & 1:
+            return True
+    return False
+
+
+def promotion_type(pieces, color):
+    """the piece type a pawn of color turns into, as Player.promotion_type (None: it stays a pawn)"""
+    counts = collections.Counter(piece_type for piece_color, piece_type, _ in pieces if piece_color == color)
+    if counts["queen"] == 0:
+        return "queen"
+    for piece_type in ("rook", "bishop", "knight"):
+        if counts[piece_type] < 2:
+            return piece_type
+    return None
+
+
+def legal_moves(pieces, color):
+    """yields (pieces after the move, True if the material changed) for every legal move of color"""
+    occupied = occupancy(pieces)
+    own = 0
+    for piece_color, _, square in pieces:
+        if piece_color == color:
+            own |= 1 << square
+    opponent = occupied ^ own
+    for i, (piece_color, piece_type, square) in enumerate(pieces):
+        if piece_color != color:
+            continue
+        if piece_type == "pawn":
+            forward, second_row, last_row = (8, 1, 7) if color == "white" else (-8, 6, 0)
+            targets = PAWN_ATTACKS[color][square] & opponent
+            one_step = square + forward
+            if 0 <= one_step < 64 and not (occupied >> one_step) & 1:
+                targets |= 1 << one_step
+                two_steps = one_step + forward
+                if square // 8 == second_row and not (occupied >> two_steps) & 1:
+                    targets |= 1 << two_steps
+        else:
+            targets = piece_attacks(piece_type, color, square, occupied) & ~own
+        for target in iter_squares(targets):
+            new_type = piece_type
+            if piece_type == "pawn" and target // 8 == last_row:
+                new_type = promotion_type(pieces, color) or "pawn"
+            new_pieces = [piece for j, piece in enumerate(pieces) if j != i and piece[2] != target]
+            new_pieces.append((color, new_type, target))
+            if not in_check(new_pieces, color, (occupied & ~(1 << square)) | (1 << target)):
+                yield new_pieces, len(new_pieces) < len(pieces) or new_type != piece_type
+
+
+def unmoves(pieces, color):
+    """yields the positions color could have come from with a quiet move (no capture, no promotion)"""
+    occupied = occupancy(pieces)
+    for i, (piece_color, piece_type, square) in enumerate(pieces):
+        if piece_color != color:
+            continue
+        if piece_type == "pawn":
+            backward, fourth_row = (-8, 3) if color == "white" else (8, 4)
+            origins = 0
+            one_step = square + backward
+            if 1 <= one_step // 8 <= 6 and not (occupied >> one_step) & 1:
+                origins |= 1 << one_step
+                two_steps = one_step + backward
+                if square // 8 == fourth_row and not (occupied >> two_steps) & 1:
+                    origins |= 1 << two_steps
+        else:
+            # the other pieces move the same way back and forth
+            origins = piece_attacks(piece_type, color, square, occupied) & ~occupied
+        for origin in iter_squares(origins):
+            yield pieces[:i] + [(color, piece_type, origin)] + pieces[i + 1:]
+
+
+def is_legal(pieces, side_to_move):
+    """True if no two pieces share a square, the pawns are on rows 2-7, the same pieces of a side are in ascending
+    square order (one index per position) and the player not to move is not in check
+    """
+    squares = [square for _, _, square in pieces]
+    if len(set(squares)) != len(squares):
+        return False
+    for i, (color, piece_type, square) in enumerate(pieces):
+        if piece_type == "pawn" and not 1 <= square // 8 <= 6:
+            return False
+        if i and pieces[i - 1][:2] == (color, piece_type) and pieces[i - 1][2] > square:
+            return False
+    return not in_check(pieces, other_color(side_to_move), occupancy(pieces))
+
+
+def plies_to_mate(value):
+    """returns the number of plies until mate of a win or loss value (None for a draw)"""
+    return abs(value) - 1 if value else None
+
+
+class Tablebase:
+    """Endgame tablebases of the positions with at most MAX_PIECES pieces, see generate and probe
+
+    args:
+    directory: str, folder of the <signature>.npy tables
+    """
+    def __init__(self, directory=TABLEBASE_DIRECTORY):
+        self.directory = directory
+        # memory-mapped tables by signature (None: not available)
+        self.tables = {}
+
+    def path(self, signature):
+        return os.path.join(self.directory, f"{signature}.npy")
+
+    def table(self, signature, generate=False):
+        """returns the table of signature, memory-mapped from its file (generated first if missing and generate)"""
+        if signature not in self.tables:
+            # a missing file is cached as None too, so that it is not looked for again at every probe
+            path = self.path(signature)
+            self.tables[signature] = np.load(path, mmap_mode="r") if os.path.exists(path) else None
+        if self.tables[signature] is None and generate:
+            self.generate(signature)
+        return self.tables[signature]
+
+    def probe_position(self, pieces, side_to_move, generate=False):
+        """returns the value (see the top of this module) of a position for the player to move,
+        None if it has more than MAX_PIECES pieces or its table is not available
+        args:
+        pieces: list of (color, piece_type, square)
+        side_to_move: str, color of the player to move
+        """
+        if len(pieces) > MAX_PIECES:
+            return None
+        if len(pieces) == 2:
+            # king against king
+            return 0
+        signature, index = position_index(pieces, side_to_move)
+        table = self.table(signature, generate)
+        if table is None:
+            return None
+        return int(table[index])
+
+    def probe(self, board):
+        """returns the value of the position of a Board for its player to move (None if not in the tablebases)"""
+        if board.bitboard.occupied.bit_count() > MAX_PIECES:
+            return None
+        pieces = [(piece.color, piece.piece_type, piece.square) for player in board.players for piece in player.pieces]
+        return self.probe_position(pieces, board.side_to_move.color)
+
+    def generate(self, signature, verbose=True):
+        """works out the table of signature by retrograde analysis and saves it (tables it depends on are generated
+        first: the ones reached by captures and promotions)
+
+        1. every legal position is scored from its moves that leave the table (looked up in the smaller tables)
+           and the number of moves that stay in it, mated positions are losses in 0 plies
+        2. starting from the mates, positions are resolved ply by ply: the predecessors (found by taking back a
+           quiet move) of a loss in n plies win in n + 1, a predecessor whose every move leads to a win of the
+           opponent loses in 1 + the longest of them; whatever is left unresolved is a draw
+        """
+        start = time.perf_counter()
+        slots = signature_slots(signature)
+        if len(slots) > MAX_PIECES:
+            raise ValueError(f"tablebases have at most {MAX_PIECES} pieces: {signature}")
+        size = 2 * 64 ** len(slots)
+        values = np.zeros(size, dtype=np.int8)
+        # moves that stay in the table and are not resolved yet
+        counts = np.zeros(size, dtype=np.uint8)
+        # True if a move leaving the table does not lose (the position cannot be lost)
+        safe = np.zeros(size, dtype=bool)
+        # longest loss (in plies) through a move leaving the table
+        exit_losses = np.zeros(size, dtype=np.int8)
+        # layers[n]: (index, win) of the positions resolved as a win / loss in n plies
+        layers = collections.defaultdict(list)
+        # taking back a move keeps the pieces in slot order, unless two of them have to be sorted by square
+        if len(set(slots)) == len(slots):
+            index_of = slot_index
+        else:
+            index_of = lambda pieces, color: position_index(pieces, color)[1]
+
+        for index in range(size):
+            pieces, color = decode_index(index, slots)
+            if not is_legal(pieces, color):
+                continue
+            opponent_color = other_color(color)
+            has_move = False
+            best_win = None
+            for new_pieces, converted in legal_moves(pieces, color):
+                has_move = True
+                if not converted:
+                    counts[index] += 1
+                    continue
+                value = self.probe_position(new_pieces, opponent_color, generate=True)
+                if value < 0:
+                    best_win = -value if best_win is None else min(best_win, -value)
+                elif value == 0:
+                    safe[index] = True
+                else:
+                    exit_losses[index] = max(exit_losses[index], value)
+
+            if not has_move:
+                if in_check(pieces, color, occupancy(pieces)):
+                    layers[0].append((index, False))
+                else:
+                    # stalemate
+                    safe[index] = True
+            elif best_win is not None:
+                layers[best_win].append((index, True))
+                safe[index] = True
+            elif counts[index] == 0 and not safe[index]:
+                layers[int(exit_losses[index])].append((index, False))
+
+        plies = 0
+        while plies <= max(layers, default=-1):
+            if plies > MAX_PLIES:
+                raise ValueError(f"{signature} has mates longer than {MAX_PLIES} plies")
+            for index, win in layers.pop(plies, []):
+                if values[index]:
+                    continue
+                values[index] = plies + 1 if win else -(plies + 1)
+                pieces, color = decode_index(index, slots)
+                previous_color = other_color(color)
+                for previous in unmoves(pieces, previous_color):
+                    if in_check(previous, color, occupancy(previous)):
+                        continue
+                    previous_index = index_of(previous, previous_color)
+                    if values[previous_index]:
+                        continue
+                    if not win:
+                        layers[plies + 1].append((previous_index, True))
+                    else:
+                        counts[previous_index] -= 1
+                        if counts[previous_index] == 0 and not safe[previous_index]:
+                            layers[max(plies + 1, int(exit_losses[previous_index]))].append((previous_index, False))
+            plies += 1
+
+        os.makedirs(self.directory, exist_ok=True)
+        np.save(self.path(signature), values)
+        self.tables[signature] = np.load(self.path(signature), mmap_mode="r")
+        if verbose:
+            # a drawn ending (e.g. KBvK) has no decided position
+            mates = f"longest mate {plies - 1} plies" if np.any(values) else "no mates"
+            print(f"{signature}: {np.count_nonzero(values > 0)} wins, {np.count_nonzero(values < 0)} losses, "
+                  f"{mates}, {time.perf_counter() - start:.1f}s")
+        return self.tables[signature]
+
+
+if __name__ == '__main__':
+    # python tablebase.py [signature ...]: generates the given tables (every 3 piece table by default)
+    tablebase = Tablebase()
+    for signature in sys.argv[1:] or DEFAULT_SIGNATURES:
+        tablebase.generate(signature)
@@ -0,0 +1,112 @@
+from array import array
+
+# Bound types of a stored score
+EXACT = 0   # the score is the exact value of the position
+LOWER = 1   # the search failed high (score >= beta): the position is worth at least score
+UPPER = 2   # the search failed low (score <= alpha): the position is worth at most score
+
+# bytes per entry: key (8), move (2), score (4), depth (1), bound (1), generation (1)
+ENTRY_BYTES = 17
+
+
+def encode_move(move):
+    """packs a Move into 12 bits: from_square | to_square << 6 (0 means no move)"""
+    return move.from_square | (move.to_square << 6)
+
+
+def find_move(moves, encoded):
+    """returns the Move of moves matching an encoded move (None if it is not among them)"""
+    if encoded:
+        from_square, to_square = encoded & 63, encoded >> 6
+        for move in moves:
+            if move.from_square == from_square and move.to_square == to_square:
+                return move
+    return None
+
+
+class TranspositionTable:
+    """Fixed-size table of searched positions keyed by Board.zobrist_key
+
+    The entries live in flat arrays sized from a memory cap and are grouped in buckets of two slots:
+    - the first slot keeps the deepest search of the current move (depth-preferred)
+    - the second slot is always replaced by whatever does not go to the first one
+    Each entry stores the depth, the bound type, the score and the best move of one search
+
+    args:
+    size_mb: float, memory used by the table in megabytes
+    """
+    def __init__(self, size_mb=16):
+        entries = max(2, int(size_mb * 1024 * 1024) // ENTRY_BYTES)
+        # number of buckets is a power of two so the bucket of a key is key & mask
+        buckets = 1
+        while buckets * 4 <= entries:
+            buckets *= 2
+        self.size = buckets * 2
+        self.mask = buckets - 1
+        self.size_mb = size_mb
+        self.keys = array("Q", bytes(8 * self.size))
+        self.moves = array("H", bytes(2 * self.size))
+        self.scores = array("i", bytes(4 * self.size))
+        self.depths = array("b", bytes(self.size))
+        self.bounds = array("b", bytes(self.size))
+        self.generations = array("B", bytes(self.size))
+        self.generation = 0
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+    def __len__(self):
+        return self.size
+
+    def clear(self):
+        """empties the table and resets the counters"""
+        self.__init__(self.size_mb)
+
+    def new_search(self):
+        """called once per move: entries of earlier moves may then be replaced in the depth-preferred slots"""
+        self.generation = (self.generation + 1) % 256
+
+    def probe(self, key):
+        """returns (depth, bound, score, encoded move) stored for key, or None"""
+        self.probes += 1
+        index = (key & self.mask) * 2
+        keys = self.keys
+        if keys[index] != key:
+            index += 1
+            if keys[index] != key:
+                return None
+        self.hits += 1
+        return self.depths[index], self.bounds[index], self.scores[index], self.moves[index]
+
+    def store(self, key, depth, bound, score, move):
+        """stores the result of a search
+        args:
+        key: int, Zobrist key of the position
+        depth: int, searched depth
+        bound: EXACT, LOWER or UPPER
+        score: int
+        move: int, best move packed with encode_move (0 if none)
+        """
+        self.stores += 1
+        index = (key & self.mask) * 2
+        if not (self.keys[index] == key or depth >= self.depths[index] or
+                self.generations[index] != self.generation):
+            # the depth-preferred slot holds a deeper search of this move: use the always-replace slot
+            index += 1
+        self.keys[index] = key
+        self.depths[index] = depth
+        self.bounds[index] = bound
+        self.scores[index] = score
+        self.moves[index] = move
+        self.generations[index] = self.generation
+
+    @property
+    def hit_rate(self):
+        """share of the probes that found their position"""
+        return self.hits / self.probes if self.probes else 0.0
+
+    def stats(self):
+        """returns the counters of the table as a dict"""
+        used = sum(1 for key in self.keys if key)
+        return {"size": self.size, "size_mb": self.size_mb, "probes": self.probes, "hits": self.hits,
+                "hit_rate": self.hit_rate, "stores": self.stores, "fill": used / self.size}
@@ -0,0 +1,35 @@
+import random
+from bitboard import COLORS, PIECE_TYPES
+
+# Zobrist hashing: every (color, piece type, square) gets a random 64-bit key and a position's key is the xor of the
+# keys of its pieces (and SIDE_KEY when black is to move), so a move updates it with a few xor-s
+# Promoted pieces (e.g. queen_new) have their own keys: they have a different id, which the neural net can see
+
+# Fixed seed so the keys (and anything stored with them, like opening books) are the same in every run
+ZOBRIST_SEED = 1000
+_rng = random.Random(ZOBRIST_SEED)
+
+PIECE_KEYS = {(color, piece_type): tuple(_rng.getrandbits(64) for _ in range(64))
+              for color in COLORS for piece_type in PIECE_TYPES}
+PROMOTED_KEYS = {(color, piece_type): tuple(_rng.getrandbits(64) for _ in range(64))
+                 for color in COLORS for piece_type in ("queen", "rook", "bishop", "knight")}
+SIDE_KEY = _rng.getrandbits(64)
+
+
+def piece_keys(piece_type, color, promoted=False):
+    """returns the 64 keys (one per square) of a piece"""
+    if promoted:
+        return PROMOTED_KEYS[(color, piece_type)]
+    return PIECE_KEYS[(color, piece_type)]
+
+
+def position_key(pieces, side_to_move):
+    """returns the key of a position from scratch
+    args:
+    pieces: iterable of Piece instances on the board
+    side_to_move: str, color of the player to move
+    """
+    key = SIDE_KEY if side_to_move == "black" else 0
+    for piece in pieces:
+        key ^= piece.zobrist_keys[piece.square]
+    return key